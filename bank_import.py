@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import csv
+import datetime
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from mail_sources import MailSource
+from transfers import TransferRecord
+
+# Header names used by the banks' CSV exports for each field we need
+CSV_COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date"),
+    "amount": ("amount", "credit", "deposit", "deposits", "cad$", "amount (cad)"),
+    "description": ("description", "description 1", "details", "transaction details", "memo", "payee"),
+    "description_extra": ("description 2", "memo 2", "notes"),
+    "reference": ("reference", "reference number", "ref", "confirmation number"),
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d", "%d-%b-%Y", "%b %d, %Y", "%Y%m%d")
+
+ETRANSFER_PATTERN = re.compile(r'e-?\s?transfer|e-?\s?trf|interac|autodeposit', re.IGNORECASE)
+# Interac reference numbers as the banks print them in descriptions, e.g. "CA1kWzVR" or a long run of digits
+REFERENCE_PATTERN = re.compile(r'\b((?=[A-Za-z]*\d)C[A-Z][A-Za-z0-9]{6,}|\d{8,})\b')
+# Outgoing e-transfers the studio sent, which must never be posted as family payments
+OUTGOING_PATTERN = re.compile(r'\b(?:sent|send|outgoing|debit|withdrawal)\b|(?:e-?\s?transfer|e-?\s?trf)\s+to\b', re.IGNORECASE)
+# Words the banks wrap around the sender's name in the description
+DESCRIPTION_NOISE = re.compile(r'interac|e-?\s?transfer|e-?\s?trf|autodeposit|\b(?:deposit|received|from|sent|send|ref)\b|[-:#*/]', re.IGNORECASE)
+
+def parse_bank_date(text):
+    text = (text or "").strip()
+    # OFX dates carry a time and timezone after the date: 20251006120000[-5:EST]
+    if re.fullmatch(r'\d{8}.*', text):
+        text = text[:8]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def parse_bank_amount(text):
+    """Signed amount; debits written as (75.00), 75.00- or 75.00 DR are negative"""
+    text = (text or "").strip()
+    negative = text.startswith("(") and text.endswith(")") or text.endswith("-") or text.upper().endswith("DR")
+    try:
+        amount = Decimal(re.sub(r'[^0-9.\-]', '', text.rstrip("-")))
+    except InvalidOperation:
+        return None
+    return -abs(amount) if negative else amount
+
+def sender_from_description(description, reference_number=None):
+    """Best guess at the sender's name from a description like 'INTERAC E-TRANSFER FROM JOHN SMITH CA1kWzVR'"""
+    if reference_number:
+        description = description.replace(reference_number, " ")
+    name = " ".join(DESCRIPTION_NOISE.sub(" ", description).split())
+    return name.title() if name else "Unknown"
+
+def make_record(source_key, date, amount, description, reference_number=None):
+    """Build the same TransferRecord the email path produces; None for rows that are not incoming e-transfers"""
+    if amount is None or amount <= 0 or not ETRANSFER_PATTERN.search(description) or OUTGOING_PATTERN.search(description):
+        return None
+    # A reference column can hold the bank's own transaction id, which never matches the email's Interac reference
+    if not reference_number or not REFERENCE_PATTERN.fullmatch(reference_number):
+        reference_match = REFERENCE_PATTERN.search(description)
+        reference_number = reference_match.group(1) if reference_match else None
+    record = TransferRecord(
+        uid=source_key,
+        # Keyed by content, not file position, so the journal recognises the same transfer in overlapping exports
+        message_key=f"bank:{reference_number}" if reference_number else f"bank:{date}|{amount}|{description}",
+        reference_number=reference_number,
+        amount=amount,
+        sender_name=sender_from_description(description, reference_number),
+        replyto_address="",
+        etransfer_message="",
+        date=date,
+    )
+    if not reference_number:
+        # Duplicate checks match on the Interac reference, so without one this row could repost a transfer already posted from its email
+        record.review_reason = "bank row has no Interac reference - check it was not already posted from its email"
+    return record
+
+def find_column(fieldnames, field):
+    for name in fieldnames:
+        if name and name.strip().lower() in CSV_COLUMNS[field]:
+            return name
+    return None
+
+def iter_csv_records(path):
+    """Yield a TransferRecord for every incoming e-transfer row in a bank CSV export"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = {field: find_column(reader.fieldnames or [], field) for field in CSV_COLUMNS}
+        if not columns["date"] or not columns["amount"] or not columns["description"]:
+            print(f"❌ {path}: could not find date/amount/description columns in {reader.fieldnames}")
+            return
+        
+        for line_number, row in enumerate(reader, start=2):
+            description = row.get(columns["description"]) or ""
+            if columns["description_extra"]:
+                description = f"{description} {row.get(columns['description_extra']) or ''}".strip()
+            reference_number = (row.get(columns["reference"]) or "").strip() if columns["reference"] else None
+            record = make_record(f"{os.path.basename(path)}:{line_number}",
+                                 parse_bank_date(row.get(columns["date"])),
+                                 parse_bank_amount(row.get(columns["amount"])),
+                                 description, reference_number)
+            if record:
+                yield record
+
+def ofx_field(block, tag):
+    """Value of an OFX tag in either SGML (no closing tag) or XML form"""
+    value_match = re.search(rf'<{tag}>([^<\r\n]*)', block, re.IGNORECASE)
+    return value_match.group(1).strip() if value_match else ""
+
+def iter_ofx_records(path):
+    """Yield a TransferRecord for every incoming e-transfer transaction in an OFX/QFX statement"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        statement = f.read()
+    
+    for block in re.findall(r'<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|</BANKTRANLIST>)', statement, re.IGNORECASE | re.DOTALL):
+        description = f"{ofx_field(block, 'NAME')} {ofx_field(block, 'MEMO')}".strip()
+        # FITID is the bank's own transaction id, not the Interac reference, so it only names the row
+        record = make_record(f"{os.path.basename(path)}:{ofx_field(block, 'FITID')}",
+                             parse_bank_date(ofx_field(block, "DTPOSTED")),
+                             parse_bank_amount(ofx_field(block, "TRNAMT")),
+                             description)
+        if record:
+            yield record
+
+def iter_bank_records(paths):
+    """Yield records from every CSV/OFX file, dropping references already seen in an earlier row or file"""
+    seen_references = set()
+    for path in paths:
+        extension = os.path.splitext(path)[1].lower()
+        records = iter_ofx_records(path) if extension in (".ofx", ".qfx") else iter_csv_records(path)
+        count = 0
+        for record in records:
+            if record.reference_number and record.reference_number in seen_references:
+                print(f"Skipping duplicate bank row for reference {record.reference_number} ({record.uid})")
+                continue
+            if record.reference_number:
+                seen_references.add(record.reference_number)
+            count += 1
+            yield record
+        print(f"✅ {path}: {count} e-transfer rows")
+
+class BankStatementSource(MailSource):
+    """Bank CSV/OFX exports as a transfer source; there are no emails to label"""
+    
+    def __init__(self, paths):
+        self.paths = paths
+    
+    def fetch_transfers(self, since=None, before=None, unseen_only=True):
+        # Statements are imported whole; the journal skips rows that were already posted
+        for record in iter_bank_records(self.paths):
+            if since and record.date and record.date < since:
+                continue
+            if before and record.date and record.date >= before:
+                continue
+            yield record
+    
+    def mark_processed(self, uid, reference_number):
+        print(f"Bank row {uid} posted for reference {reference_number}")
+        return True
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import shutil
+import sys
+import tempfile
+import time
+import dance_ink_bot
+from config import chrome_user_data_dir
+
+def timed_launch(user_data_dir):
+    """Launch Chrome and reach the admin page, returning (launch seconds, login seconds)"""
+    start = time.monotonic()
+    dance_ink_bot.driver = dance_ink_bot.start_browser(user_data_dir)
+    launched = time.monotonic()
+    dance_ink_bot.driver.quit()
+    
+    # login_to_studio_director() starts its own browser and skips the form when the session is still valid
+    login_start = time.monotonic()
+    logged_in = dance_ink_bot.login_to_studio_director(user_data_dir)
+    login_time = time.monotonic() - login_start
+    dance_ink_bot.driver.quit()
+    
+    if not logged_in:
+        print("❌ Login failed during benchmark")
+    return launched - start, login_time
+
+def bench_chrome_startup(runs=3):
+    results = {"cold": [], "warm": []}
+    
+    for i in range(runs):
+        # Cold: brand new profile, nothing cached and no session cookie
+        cold_dir = tempfile.mkdtemp(prefix="dance-ink-cold-")
+        try:
+            results["cold"].append(timed_launch(cold_dir))
+        finally:
+            shutil.rmtree(cold_dir, ignore_errors=True)
+        
+        # Warm: the persistent profile configured for the bot
+        results["warm"].append(timed_launch(chrome_user_data_dir))
+        print(f"Run {i+1}: cold={results['cold'][-1]}, warm={results['warm'][-1]}")
+    
+    print("\n=== Chrome Startup Benchmark ===")
+    for kind, samples in results.items():
+        launch = sum(s[0] for s in samples) / len(samples)
+        login = sum(s[1] for s in samples) / len(samples)
+        print(f"{kind:>5}: launch {launch:.2f}s, launch + login {login:.2f}s (avg of {len(samples)})")
+
+if __name__ == "__main__":
+    bench_chrome_startup(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import email
+import sys
+import time
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from transfers import is_etransfer, iter_transfer_records
+
+def synthetic_mailbox(count, attachment_kb):
+    """Yield (uid, raw bytes) for a mailbox of e-transfer notifications with attachments, like an IMAP fetch would"""
+    attachment = b"x" * (attachment_kb * 1024)
+    for i in range(count):
+        msg = MIMEMultipart()
+        msg["Subject"] = "INTERAC e-Transfer: You've received $120.00"
+        msg["Date"] = formatdate(1760000000 + i * 60)
+        msg["Message-ID"] = make_msgid()
+        msg["Reply-To"] = f"Parent {i} <parent{i}@example.com>"
+        msg.attach(MIMEText(
+            f"Sent From: PARENT {i}\nAmount: $120.00\nMessage: Student {i}\nReference Number: CA{i:010d}\n"
+        ))
+        msg.attach(MIMEApplication(attachment, Name="logo.png"))
+        yield str(i).encode(), msg.as_bytes()
+
+def list_of_messages(count, attachment_kb):
+    """The old fetch_emails(): every full Message object held in a list before processing"""
+    emails = []
+    for uid, raw in synthetic_mailbox(count, attachment_kb):
+        msg = email.message_from_bytes(raw)
+        if is_etransfer(msg):
+            emails.append((msg, uid))
+    return len(emails)
+
+def streamed_records(count, attachment_kb):
+    """The streaming fetch: compact records, raw message dropped after parsing"""
+    records = list(iter_transfer_records(synthetic_mailbox(count, attachment_kb)))
+    return len(records)
+
+def measure(label, func, count, attachment_kb):
+    tracemalloc.start()
+    start = time.monotonic()
+    processed = func(count, attachment_kb)
+    elapsed = time.monotonic() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>16}: {processed} messages, peak {peak / 1024 / 1024:.1f} MiB, {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    attachment_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"=== Fetch Memory Benchmark: {count} messages, {attachment_kb} KiB attachment each ===")
+    measure("list of Message", list_of_messages, count, attachment_kb)
+    measure("streamed records", streamed_records, count, attachment_kb)
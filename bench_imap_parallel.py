@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import imaplib
+import socketserver
+import sys
+import threading
+import time
+from email.utils import formatdate
+from imap_pool import IMAPConnectionPool
+
+LATENCY = 0.05  # Seconds added to every IMAP command, like a round-trip to Gmail
+
+def make_message(uid):
+    return (
+        f"Subject: INTERAC e-Transfer: You've received $120.00\r\n"
+        f"Date: {formatdate(1760000000 + uid * 60)}\r\n"
+        f"Message-ID: <{uid}@bench.local>\r\n"
+        f"Reply-To: Parent {uid} <parent{uid}@example.com>\r\n\r\n"
+        f"Sent From: PARENT {uid}\r\nAmount: $120.00\r\nReference Number: CA{uid:010d}\r\n"
+    ).encode()
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP4rev1 for LOGIN, SELECT, UID SEARCH, UID FETCH and LOGOUT"""
+    
+    def respond(self, text):
+        self.wfile.write(text.encode() if isinstance(text, str) else text)
+    
+    def handle(self):
+        self.respond("* OK [CAPABILITY IMAP4rev1] bench ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            time.sleep(LATENCY)
+            tag, command, *rest = line.decode().strip().split(" ", 2)
+            args = rest[0] if rest else ""
+            command = command.upper()
+            if command == "CAPABILITY":
+                self.respond(f"* CAPABILITY IMAP4rev1\r\n{tag} OK done\r\n")
+            elif command == "LOGIN":
+                self.respond(f"{tag} OK logged in\r\n")
+            elif command in ("SELECT", "EXAMINE"):
+                self.respond(f"* {self.server.message_count} EXISTS\r\n{tag} OK [READ-WRITE] selected\r\n")
+            elif command == "UID" and args.upper().startswith("SEARCH"):
+                uids = " ".join(str(uid) for uid in range(1, self.server.message_count + 1))
+                self.respond(f"* SEARCH {uids}\r\n{tag} OK search done\r\n")
+            elif command == "UID" and args.upper().startswith("FETCH"):
+                uid_set = args.split(" ")[1]
+                for uid in (int(uid) for uid in uid_set.split(",")):
+                    body = make_message(uid)
+                    self.respond(f"* {uid} FETCH (UID {uid} BODY[] {{{len(body)}}}\r\n".encode() + body + b")\r\n")
+                self.respond(f"{tag} OK fetch done\r\n")
+            elif command == "LOGOUT":
+                self.respond(f"* BYE\r\n{tag} OK bye\r\n")
+                return
+            else:
+                self.respond(f"{tag} BAD unsupported\r\n")
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def fetch_serial(port, uids):
+    """The original approach: one connection, one UID FETCH per message"""
+    connection = imaplib.IMAP4("127.0.0.1", port)
+    connection.login("bench", "bench")
+    connection.select("inbox")
+    count = 0
+    for uid in uids:
+        result, msg_data = connection.uid('fetch', uid, '(BODY.PEEK[])')
+        count += bool(msg_data[0][1])
+    connection.logout()
+    return count
+
+def fetch_pooled(port, uids, connections):
+    pool = IMAPConnectionPool(lambda: imaplib.IMAP4("127.0.0.1", port), "bench", "bench", max_connections=connections)
+    try:
+        return sum(1 for uid, raw in pool.fetch(uids))
+    finally:
+        pool.close()
+
+if __name__ == "__main__":
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    server = FakeIMAPServer(("127.0.0.1", 0), FakeIMAPHandler)
+    server.message_count = message_count
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    uids = [str(uid).encode() for uid in range(1, message_count + 1)]
+    
+    print(f"=== IMAP Fetch Benchmark: {message_count} messages, {LATENCY * 1000:.0f} ms per command ===")
+    start = time.monotonic()
+    count = fetch_serial(port, uids)
+    print(f"serial, 1 connection: {count} messages in {time.monotonic() - start:.2f}s")
+    for connections in (1, 2, 4):
+        start = time.monotonic()
+        count = fetch_pooled(port, uids, connections)
+        print(f"pooled, {connections} connection(s): {count} messages in {time.monotonic() - start:.2f}s")
+    server.shutdown()
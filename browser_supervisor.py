@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import threading
+from contextlib import contextmanager
+import metrics
+import process_tree
+from process_tree import pid_alive, process_tree_pids, process_tree_rss_mib
+
+class BrowserHung(Exception):
+    """An operation ran past its hard timeout and the browser was killed"""
+
+class BrowserSupervisor:
+    """Watches the Chrome process tree between payments and decides when to recycle it"""
+    
+    def __init__(self, restart_after_payments, max_rss_mib, operation_timeout):
+        self.restart_after_payments = restart_after_payments
+        self.max_rss_mib = max_rss_mib
+        self.operation_timeout = operation_timeout
+        self.root_pid = None
+        self.payments = 0
+        self.killed = None  # Name of the operation that hung, until the browser is restarted
+        if max_rss_mib and not process_tree.available:
+            print("⚠️ Cannot read process memory here (install psutil) - the browser memory limit is disabled")
+    
+    def started(self, driver):
+        """Start watching a freshly launched browser"""
+        # chromedriver is the parent of every Chrome process it launched
+        self.root_pid = driver.service.process.pid
+        self.payments = 0
+        self.killed = None
+        self.sample(driver)
+    
+    def payment_done(self):
+        self.payments += 1
+    
+    def sample(self, driver):
+        """Record Chrome's memory and open page count; returns the RSS in MiB"""
+        rss = process_tree_rss_mib(self.root_pid) if self.root_pid else 0
+        metrics.sample("browser_rss_mib", rss)
+        try:
+            metrics.sample("browser_pages", len(driver.window_handles))
+        except Exception:
+            pass
+        return rss
+    
+    def restart_reason(self, driver):
+        """Why the browser should be restarted before the next payment, or None"""
+        if self.killed:
+            return f"hung in {self.killed}"
+        if self.restart_after_payments and self.payments >= self.restart_after_payments:
+            return f"{self.payments} payments"
+        rss = self.sample(driver)
+        if self.max_rss_mib and rss > self.max_rss_mib:
+            return f"{rss:.0f} MiB above the {self.max_rss_mib} MiB limit"
+        return None
+    
+    def kill(self, operation=None, pids=None):
+        """Hard-kill chromedriver and every Chrome process under it"""
+        if not self.root_pid:
+            return
+        if operation:
+            print(f"❌ {operation} ran past {self.operation_timeout}s - killing the browser")
+            self.killed = operation
+            metrics.increment("browser_killed")
+        for pid in reversed(pids if pids is not None else process_tree_pids(self.root_pid)):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+    
+    def stop(self, driver):
+        """Quit the browser, then kill whatever is left of its process tree (orphaned renderers, or all of it after a hang)"""
+        pids = process_tree_pids(self.root_pid) if self.root_pid else []
+        try:
+            if not self.killed:
+                driver.quit()
+        except Exception as e:
+            print(f"Browser did not quit cleanly: {e}")
+        self.kill(pids=[pid for pid in pids if pid_alive(pid)])
+        self.root_pid = None
+    
+    @contextmanager
+    def operation(self, name):
+        """Kill the browser if the wrapped block takes longer than operation_timeout, so a hung tab cannot stall the run"""
+        watchdog = threading.Timer(self.operation_timeout, self.kill, args=(name,))
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            yield
+        except Exception as e:
+            # The WebDriver call that was cut off fails with a connection error; report it as the hang it was
+            if self.killed == name:
+                raise BrowserHung(f"{name} exceeded {self.operation_timeout}s") from e
+            raise
+        finally:
+            watchdog.cancel()
+        if self.killed == name:
+            raise BrowserHung(f"{name} exceeded {self.operation_timeout}s")
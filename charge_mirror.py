@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import datetime
+import html
+import json
+import re
+import sqlite3
+
+# Summary rows of the Current Unpaid Charges table that are not charges
+SUMMARY_ROWS = (
+    "Category",
+    "Total unpaid charges",
+    "Current payments not applied to unpaid charges or current charges paid by future payments",
+    "Current Balance Due",
+)
+
+CHARGE_ROW_PATTERN = re.compile(r'<tr[^>]*>\s*<td[^>]*>(.*?)</td>\s*<td[^>]*>(.*?)</td>', re.DOTALL | re.IGNORECASE)
+
+def parse_unpaid_charges_html(page_source):
+    """Read {category: amount} from the Current Unpaid Charges table of the payment form HTML in one pass; None when the table is missing"""
+    start = page_source.find("Current Unpaid Charges")
+    if start == -1:
+        return None
+    end = page_source.find("</table>", page_source.find("ReportTable", start))
+    unpaid_charges = {}
+    for category, amount_text in CHARGE_ROW_PATTERN.findall(page_source[start:end if end != -1 else None]):
+        category = html.unescape(re.sub(r'<[^>]+>', '', category)).strip()
+        amount_match = re.search(r'([\d,]+\.?\d*)', re.sub(r'<[^>]+>', '', amount_text))
+        if category and category not in SUMMARY_ROWS and amount_match:
+            amount = float(amount_match.group(1).replace(',', ''))
+            if amount > 0:
+                unpaid_charges[category] = amount
+    return unpaid_charges
+
+class ChargeMirror:
+    """Local copy of each family's unpaid charges, keyed by ledger URL and tied to the ledger balance it was read at"""
+    
+    def __init__(self, db_path, max_age_hours):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS unpaid_charges (
+                family_key TEXT PRIMARY KEY,
+                charges TEXT NOT NULL,
+                balance REAL,
+                refreshed_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.max_age = datetime.timedelta(hours=max_age_hours)
+    
+    def get(self, family_key, current_balance):
+        """Mirrored charges, or None when missing, too old, or the ledger balance has moved since they were read"""
+        row = self.conn.execute(
+            "SELECT charges, balance, refreshed_at FROM unpaid_charges WHERE family_key = ?", (family_key,)
+        ).fetchone()
+        if not row:
+            return None
+        charges, balance, refreshed_at = row
+        if datetime.datetime.now() - datetime.datetime.fromisoformat(refreshed_at) > self.max_age:
+            return None
+        # Any charge or payment posted outside the bot changes the balance, so an unchanged balance means unchanged charges
+        if balance is None or current_balance is None or abs(balance - current_balance) >= 0.01:
+            return None
+        return json.loads(charges)
+    
+    def replace(self, family_key, unpaid_charges, balance):
+        """Store charges freshly read from the payment form"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO unpaid_charges (family_key, charges, balance, refreshed_at) VALUES (?, ?, ?, ?)",
+            (family_key, json.dumps(unpaid_charges), balance, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+    
+    def apply_payment(self, family_key, unpaid_charges, allocations, new_balance):
+        """Update the mirror in place after a post instead of reading the form again"""
+        remaining = dict(unpaid_charges)
+        for category, amount in allocations:
+            if category in remaining:
+                remaining[category] = round(remaining[category] - float(amount), 2)
+                if remaining[category] <= 0:
+                    del remaining[category]
+        self.replace(family_key, remaining, new_balance)
+    
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM unpaid_charges").fetchone()[0]
+    
+    def close(self):
+        self.conn.close()
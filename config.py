@@ -7,6 +7,12 @@ safe_mode = False
 # Set headless mode to True for headless operation (no GUI)
 headless = False
 
+# Persistent Chrome profile so the Studio Director session survives between runs (None for a fresh profile)
+chrome_user_data_dir = "./chrome-profile"
+
+# Assets blocked during page loads (images are also disabled through Chrome prefs); empty to load everything
+blocked_asset_patterns = ("*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css")
+
 # Set buffer time in seconds
 buffer = 1
 
@@ -17,9 +23,21 @@ load_dotenv("./passwords.env")
 email_username = os.getenv("EMAIL_USERNAME")
 email_password = os.getenv("EMAIL_PASSWORD")
 
+# IMAP server, the most connections the bot may open to it at once, and emails fetched per request on large scans
+imap_host = "imap.gmail.com"
+imap_max_connections = 4
+imap_fetch_batch_size = 50
+
+# Key for the encrypted Studio Director session cookie store (generate with Fernet.generate_key())
+session_store_key = os.getenv("SESSION_STORE_KEY")
+session_store_path = "./session_cookies.enc"
+
 # Dance Ink Studio Director URL
 studio_director_url = "https://app.thestudiodirector.com/danceink/login.sd"
 
+# Dance Ink Studio Director admin page (search, family accounts)
+studio_director_admin_url = studio_director_url.replace("login.sd", "admin.sd")
+
 #  Shotokan Karate Studio Director URL
 shotokan_studio_director_url = "https://app.thestudiodirector.com/shotokankarateyxe/login.sd"
 
@@ -32,4 +50,58 @@ shotokan_studio_director_password = os.getenv("SHOTOKAN_PASSWORD")
 # Set category hierarchy for payments
 category_hierarchy = ("Registration", "Costume Deposit", "Tuition", "Exam Fee")
 
+# File that remembers which selector last worked for each element
+selector_cache_path = "./selector_cache.json"
+
+# Local SQLite database for the payment journal and other run state
+state_db_path = "./dance_ink_bot.db"
+
+# Search used to list every family when indexing posted references ("@" matches every family email)
+family_listing_query = "@"
+
+# Family search results verified at the same time
+candidate_fetch_workers = 4
+
+# Sender-name matches below this score, or too close to the runner-up, go to review instead of being posted
+family_match_threshold = 0.85
+family_match_margin = 0.1
+
+# Failed e-transfers are retried after retry_backoff_hours, doubling each attempt, then moved to the review list
+retry_backoff_hours = 6
+retry_max_attempts = 5
+
+# Days of unread mail checked by a normal run
+lookback_days = 11
+
+# Days of mail handled per checkpointed chunk in backfill mode
+backfill_chunk_days = 7
+
+# Mirrored unpaid charges are re-read from the payment form after this long even if the balance is unchanged
+charge_mirror_max_age_hours = 168
+
+# Restart Chrome (restoring the session) after this many e-transfers or above this memory, and kill it when one e-transfer hangs
+browser_restart_after_payments = 50
+browser_max_rss_mib = 1500
+browser_operation_timeout = 300
+page_load_timeout = 60
+
+# Seconds one e-transfer may spend before its remaining fallbacks are skipped and it is retried later
+email_time_budget = 120
+
+# schedule mode: minutes between runs, random extra seconds per run, and (start hour, end hour) with no runs
+schedule_interval_minutes = 30
+schedule_jitter_seconds = 120
+schedule_quiet_hours = (22, 7)
+
+# Lock file that keeps two runs (cron, schedule or manual) from overlapping
+lock_path = "./dance_ink_bot.lock"
+
+# Which e-transfers a time-limited run (run --max-runtime, or each schedule tick) posts first: "oldest" or "largest"
+run_order = "oldest"
+
+# Where --trace writes one network trace file per run
+trace_dir = "./traces"
 
+# Where --profile writes speedscope files, and how often it samples the main thread
+profile_dir = "./profiles"
+profile_interval_ms = 5
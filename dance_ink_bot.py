@@ -6,13 +6,32 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.chrome.options import Options
+import argparse
+import html
+import os
+import random
 import time
-import imaplib
 import datetime
-import email
 import re
-from email.utils import parsedate_to_datetime
-from config import studio_director_url, studio_director_username, studio_director_password, headless, safe_mode, buffer, email_username, email_password
+from concurrent.futures import ThreadPoolExecutor
+from config import studio_director_url, studio_director_admin_url, studio_director_username, studio_director_password, headless, safe_mode, buffer, email_username, email_password, selector_cache_path, chrome_user_data_dir, blocked_asset_patterns, state_db_path, family_listing_query, candidate_fetch_workers, family_match_threshold, family_match_margin, retry_backoff_hours, retry_max_attempts, lookback_days, backfill_chunk_days, charge_mirror_max_age_hours, browser_restart_after_payments, browser_max_rss_mib, browser_operation_timeout, page_load_timeout, email_time_budget, schedule_interval_minutes, schedule_jitter_seconds, schedule_quiet_hours, lock_path, run_order, trace_dir, profile_dir, profile_interval_ms, imap_host, imap_max_connections, imap_fetch_batch_size
+from selector_registry import SelectorRegistry
+import metrics
+import session_store
+from payment_journal import PaymentJournal
+from reference_index import ReferenceIndex, extract_ledger_notes
+from family_index import FamilyNameIndex, names_agree, normalize_tokens
+from retry_queue import RetryQueue
+from run_history import RunHistory
+from charge_mirror import ChargeMirror, parse_unpaid_charges_html
+from browser_supervisor import BrowserSupervisor
+import deadline
+from run_lock import single_instance
+from network_trace import NetworkTrace
+import sampling_profiler
+from sampling_profiler import SamplingProfiler
+from mail_sources import open_mail_source
+from bank_import import BankStatementSource
 
 # Add debugging for email credentials
 print(f"Email username: {email_username}")
@@ -24,21 +43,125 @@ print(f"Safe mode: {safe_mode}")
 
 # Initialize WebDriver as a global variable
 driver = None
-mail = None  # Add global mail variable
+mail_source = None  # Live IMAP mailbox or offline mail files
+network_trace = None  # Set by --trace to record DevTools network events per step
 
-def login_to_studio_director():
-    global driver
-    
-    # Configure Chrome options
+# Element lookups that remember the locator that last worked
+selectors = SelectorRegistry(selector_cache_path)
+
+# Per-email progress, so an interrupted run resumes instead of reposting
+journal = PaymentJournal(state_db_path)
+
+# E-transfer references already posted, per family ledger
+reference_index = ReferenceIndex(state_db_path)
+
+# Family and guardian names for matching bank sender names
+family_index = FamilyNameIndex(state_db_path)
+
+# Failed e-transfers waiting for their next attempt, and the review list of permanent failures
+retry_queue = RetryQueue(state_db_path, retry_backoff_hours, retry_max_attempts)
+
+# Unpaid charges per family, so the payment form only has to confirm them
+charge_mirror = ChargeMirror(state_db_path, charge_mirror_max_age_hours)
+
+# Recycles Chrome during long runs and kills it when an e-transfer hangs
+browser_supervisor = BrowserSupervisor(browser_restart_after_payments, browser_max_rss_mib, browser_operation_timeout)
+
+# One summary row per run, for the trends command
+run_history = RunHistory(state_db_path)
+
+def build_chrome_options(user_data_dir=chrome_user_data_dir):
+    """Chrome launch profile tuned for fast startup and page loads"""
     chrome_options = Options()
     if headless:
-        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--no-first-run")
+    chrome_options.add_argument("--no-default-browser-check")
+    
+    # Return control as soon as the DOM is ready instead of waiting for every asset
+    chrome_options.page_load_strategy = "eager"
+    
+    # Keep the profile (and the Studio Director session cookie) between runs
+    if user_data_dir:
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(user_data_dir)}")
+    
+    if network_trace:
+        chrome_options.set_capability("goog:loggingPrefs", NetworkTrace.logging_prefs())
+    
+    if blocked_asset_patterns:
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    
+    return chrome_options
+
+def start_browser(user_data_dir=chrome_user_data_dir):
+    """Launch Chrome with the tuned profile and block heavy assets over CDP"""
+    browser = webdriver.Chrome(options=build_chrome_options(user_data_dir))
+    browser.set_page_load_timeout(page_load_timeout)
+    
+    if blocked_asset_patterns:
+        try:
+            browser.execute_cdp_cmd("Network.enable", {})
+            browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked_asset_patterns)})
+            print(f"Blocking {len(blocked_asset_patterns)} asset patterns")
+        except Exception as e:
+            print(f"⚠️ Could not block assets over CDP: {e}")
+    
+    if network_trace:
+        network_trace.enable(browser)
+    
+    return browser
+
+def trace_step(step):
+    """Start attributing network requests to step (no-op unless tracing)"""
+    if network_trace and driver is not None:
+        network_trace.set_step(driver, step)
+
+def studio_director_session_active():
+    """Check whether the browser profile still holds a valid Studio Director session"""
+    try:
+        driver.get(studio_director_admin_url)
+        if "admin.sd" in driver.current_url and not driver.find_elements(By.NAME, "password"):
+            return True
+    except Exception as e:
+        print(f"Could not check existing session: {e}")
+    return False
+
+@sampling_profiler.phase("login")
+def login_to_studio_director(user_data_dir=chrome_user_data_dir):
+    global driver
     
     # Initialize the WebDriver
-    driver = webdriver.Chrome(options=chrome_options)
+    driver = start_browser(user_data_dir)
+    browser_supervisor.started(driver)
+    trace_step("login")
     
+    if user_data_dir and studio_director_session_active():
+        print("✅ Reusing existing Studio Director session - skipping login")
+        return True
+    
+    # Try the encrypted cookies exported by an earlier run or another worker
+    cookies = session_store.load_cookies()
+    if cookies:
+        # One plain HTTP request tells whether they are still valid, before any browser navigation
+        if session_store.cookies_valid(cookies):
+            session_store.apply_to_driver(driver, cookies)
+            print("✅ Restored Studio Director session from stored cookies - skipping login")
+            return True
+        print("Stored session has expired, logging in again")
+        session_store.clear_cookies()
+    
+    if submit_login_form():
+        session_store.save_cookies(driver.get_cookies())
+        return True
+    return False
+
+def submit_login_form():
+    """Enter the credentials on the login page and confirm we reached the admin page"""
     try:
         print("Logging in to Studio Director...")
         
@@ -104,84 +227,31 @@ def login_to_studio_director():
         print(f"❌ Login failed with error: {e}")
         return False
 
-def fetch_emails():
-    global mail  # Make mail global so we can use it later
-    try:
-        # Connect to the email server
-        mail = imaplib.IMAP4_SSL('imap.gmail.com')
-        mail.login(email_username, email_password)
-        mail.select('inbox')
-
-        # Get emails from the last n days - ONLY UNREAD emails
-        n = 11  # Changed from 1 to 30 days to capture all October e-transfers
-        start_date = (datetime.date.today() - datetime.timedelta(days=n)).strftime("%d-%b-%Y")
-        
-        # Search for UNREAD emails only from the specified date range
-        search_criteria = f'(SENTSINCE {start_date} UNSEEN)'
-        result, data = mail.search(None, search_criteria)
-        
-        email_ids = data[0].split() if data[0] else []
-        print(f"Fetched {len(email_ids)} UNREAD emails from the last {n} days.")
-
-        emails = []
-        for email_id in email_ids:
-            # Use BODY.PEEK instead of RFC822 to avoid marking email as read during fetch
-            result, msg_data = mail.fetch(email_id, '(BODY.PEEK[])')
-            msg = email.message_from_bytes(msg_data[0][1])
-            
-            subject = msg["Subject"] or ""
-            print(f"Found email with subject: '{subject}'")
-            
-            # Only process e-transfer emails
-            if msg["Subject"] and "e-Transfer" in msg["Subject"]:
-                print(f"✅ This is an e-transfer email: {subject}")
-                emails.append((msg, email_id))  # Store both message and ID
-            else:
-                print(f"❌ Skipping non-e-transfer email: {subject}")
+def open_default_mail_source(spec="imap"):
+    """Open the live Gmail mailbox, or an offline mbox/Maildir/.eml source at a path"""
+    global mail_source
+    mail_source = open_mail_source(spec, {
+        "host": imap_host,
+        "username": email_username,
+        "password": email_password,
+        "max_connections": imap_max_connections,
+        "batch_size": imap_fetch_batch_size,
+    })
+    print(f"Reading e-transfers from {type(mail_source).__name__} ({spec})")
+    return mail_source
 
-        # Don't logout here - we need the connection for later
-        return emails
-        
-    except Exception as e:
-        print(f"Error fetching emails: {e}")
-        return []
+def fetch_emails(since=None, before=None, unseen_only=True):
+    """Yield a TransferRecord for each e-transfer email in the date range, fetching and parsing one message at a time"""
+    if mail_source is None:
+        open_default_mail_source()
+    
+    # By default look back lookback_days for UNREAD emails only
+    since = since or datetime.date.today() - datetime.timedelta(days=lookback_days)
+    yield from mail_source.fetch_transfers(since, before, unseen_only)
 
-def mark_email_processed(email_id, reference_number):
-    """Mark email as read and apply '2025 Payments EFT's' label"""
-    global mail
-    try:
-        # Mark email as read
-        mail.store(email_id, '+FLAGS', '\\Seen')
-        print(f"✅ Marked email {email_id} as read")
-        
-        # Create/apply the Gmail label
-        label_name = "2025 Payments EFT's"
-        
-        # First, try to create the label (in case it doesn't exist)
-        try:
-            mail.create(label_name)
-            print(f"Created Gmail label: {label_name}")
-        except:
-            # Label already exists, which is fine
-            pass
-        
-        # Apply the label to the email
-        try:
-            mail.store(email_id, '+X-GM-LABELS', label_name)
-            print(f"✅ Applied label '{label_name}' to email {email_id}")
-        except Exception as label_error:
-            print(f"⚠️ Could not apply label: {label_error}")
-            # Try alternative Gmail labeling method
-            try:
-                mail.copy(email_id, label_name)
-                print(f"✅ Applied label '{label_name}' using copy method")
-            except Exception as copy_error:
-                print(f"❌ Failed to apply label with any method: {copy_error}")
-        
-        print(f"Email processing completed for reference {reference_number}")
-        
-    except Exception as e:
-        print(f"❌ Error marking email as processed: {e}")
+def mark_email_processed(uid, reference_number):
+    """Mark the email as read and apply the payments label (no-op for offline sources)"""
+    return mail_source.mark_processed(uid, reference_number)
 
 def parse_unpaid_charges(driver):
     """Parse unpaid charges from the Current Unpaid Charges section"""
@@ -462,15 +532,179 @@ def calculate_payment_allocation(payment_amount, unpaid_charges):
     allocations.append(("Tuition", payment_amount))
     return allocations
 
+# Category option maps per Studio Director tenant, e.g. {"danceink": {"Tuition": "12", ...}}
+category_option_cache = {}
+
+# Builds every split row, fills amounts and categories and reads the form back in one round-trip.
+# Alerts raised by the page's validation handlers are collected instead of blocking the script.
+SPLIT_PAYMENT_SCRIPT = """
+var rows = arguments[0];
+var alerts = [];
+var originalAlert = window.alert;
+window.alert = function(message) { alerts.push(String(message)); };
+try {
+    var button = document.getElementById('splitpayment');
+    var clicks = 0;
+    while (button && !document.getElementsByName('paid_toward' + rows.length).length && clicks <= rows.length) {
+        button.click();
+        clicks++;
+    }
+    var fire = function(element) {
+        ['input', 'change', 'blur'].forEach(function(type) {
+            element.dispatchEvent(new Event(type, {bubbles: true}));
+        });
+    };
+    var options = [];
+    var firstSelect = document.getElementsByName('paid_toward1')[0];
+    if (firstSelect) {
+        for (var o = 0; o < firstSelect.options.length; o++) {
+            options.push([firstSelect.options[o].value, firstSelect.options[o].text.trim()]);
+        }
+    }
+    var readBack = [];
+    for (var i = 0; i < rows.length; i++) {
+        var amountField = document.getElementsByName('split_amt' + (i + 1))[0];
+        var categorySelect = document.getElementsByName('paid_toward' + (i + 1))[0];
+        if (amountField && rows[i].amount !== null) {
+            amountField.value = rows[i].amount;
+            fire(amountField);
+        }
+        if (categorySelect && rows[i].value !== null) {
+            categorySelect.value = rows[i].value;
+            fire(categorySelect);
+        }
+        readBack.push({
+            amount: amountField ? amountField.value : null,
+            value: categorySelect ? categorySelect.value : null
+        });
+    }
+    return {clicks: clicks, options: options, rows: readBack, alerts: alerts};
+} finally {
+    window.alert = originalAlert;
+}
+"""
+
+def get_studio_tenant():
+    """Return the Studio Director tenant slug (e.g. 'danceink') from the login URL"""
+    return studio_director_url.split("thestudiodirector.com/")[1].split("/")[0]
+
+def match_category_option(category, options):
+    """Return the option value for a category using exact, partial and keyword matching"""
+    for text, value in options.items():
+        if text == category:
+            return value
+    
+    for text, value in options.items():
+        if category.lower() in text.lower() or text.lower() in category.lower():
+            return value
+    
+    keywords = {"tuition": ("tuition",), "costume": ("costume",), "private": ("private", "lesson")}
+    for key, option_words in keywords.items():
+        if key in category.lower():
+            for text, value in options.items():
+                if any(word in text.lower() for word in option_words):
+                    return value
+    
+    return None
+
+def fill_split_payment(allocations, set_amounts=True):
+    """Fill all split rows (split_amt{n} and paid_toward{n}) in a single script execution"""
+    tenant = get_studio_tenant()
+    options = category_option_cache.get(tenant)
+    
+    if options is None:
+        # First form of the run for this tenant: build the rows and learn the option map in the same call
+        result = driver.execute_script(SPLIT_PAYMENT_SCRIPT, [{"amount": None, "value": None} for _ in allocations])
+        options = {text: value for value, text in result["options"] if text}
+        category_option_cache[tenant] = options
+        print(f"Cached {len(options)} category options for tenant '{tenant}': {list(options.keys())}")
+    
+    rows = []
+    for category, allocation_amount in allocations:
+        value = match_category_option(category, options)
+        if value is None:
+            print(f"⚠️ Could not find matching option for category: {category}")
+        amount_str = f"{float(allocation_amount):.2f}" if set_amounts else None
+        rows.append({"amount": amount_str, "value": value})
+    
+    result = driver.execute_script(SPLIT_PAYMENT_SCRIPT, rows)
+    print(f"Split rows ready after {result['clicks']} Split Payment click(s)")
+    for alert_text in result["alerts"]:
+        print(f"⚠️ Alert suppressed while filling split rows: {alert_text}")
+    
+    # Verify every row from the single read-back
+    mismatches = []
+    for i, (expected, actual) in enumerate(zip(rows, result["rows"])):
+        field_number = i + 1
+        amount_ok = expected["amount"] is None or actual["amount"] == expected["amount"]
+        # A category with no matching option is a failure too: the payment would land on whatever the row defaults to
+        category_ok = expected["value"] is not None and actual["value"] == expected["value"]
+        if amount_ok and category_ok:
+            print(f"✅ Split row {field_number}: amount='{actual['amount']}', paid_toward='{actual['value']}'")
+        else:
+            print(f"❌ Split row {field_number}: expected {expected}, got {actual}")
+            mismatches.append(field_number)
+    
+    # A row whose fields were missing reads back as null and fails the comparison above
+    return not mismatches
+
+def parse_money(text):
+    """Parse an amount like '$1,234.50', '-$20.00' or '($20.00)' into a float"""
+    match = re.search(r'(-|\()?\s*\$?\s*([\d,]+\.?\d*)', text or "")
+    if not match:
+        return None
+    value = float(match.group(2).replace(',', ''))
+    return -value if match.group(1) else value
+
+def parse_current_balance(page_source):
+    """Read the #current-balance value straight from page HTML"""
+    match = re.search(r'id=["\']current-balance["\'][^>]*>(.*?)</', page_source, re.DOTALL)
+    if not match:
+        return None
+    return parse_money(re.sub(r'<[^>]+>', '', match.group(1)))
+
+def expected_balance_after_payment(payment_amount, balance_before, unpaid_charges):
+    """Balance the ledger should show once the payment is applied"""
+    payment_amount = float(str(payment_amount).replace(',', ''))
+    if balance_before is not None:
+        return round(balance_before - payment_amount, 2)
+    if unpaid_charges:
+        return round(sum(unpaid_charges.values()) - payment_amount, 2)
+    return None
+
+def fetch_balance_after_save(ledger_url, from_response=True):
+    """Return the post-save balance from the save response, or from one direct ledger request"""
+    with metrics.timer("verify_balance"):
+        if from_response:
+            balance = parse_current_balance(driver.page_source)
+            if balance is not None:
+                print("Read balance from the save response")
+                return balance
+            
+            # The confirmation page links to the ledger; fetch it over HTTP instead of navigating
+            review_ledger_link = selectors.find(driver, "payment_saved", "review_ledger_link")
+            if review_ledger_link and review_ledger_link.get_attribute("href"):
+                ledger_url = review_ledger_link.get_attribute("href")
+        
+        if not ledger_url:
+            print("No ledger URL available for balance check")
+            return None
+        
+        try:
+            final_url, page_source = session_store.open_url(ledger_url, driver.get_cookies())
+            balance = parse_current_balance(page_source)
+            print(f"Fetched ledger balance directly from {final_url}: {balance}")
+            return balance
+        except Exception as e:
+            print(f"Error fetching ledger balance: {e}")
+            return None
+
 def cleanup_email_connection():
     """Close the email connection"""
-    global mail
-    try:
-        if mail:
-            mail.logout()
-            print("Email connection closed")
-    except:
-        pass
+    global mail_source
+    if mail_source:
+        mail_source.close()
+    mail_source = None
 
 def verify_family_email_match(target_email):
     """Verify if current family page has matching email in email or extra_emails fields within Overview tab"""
@@ -541,7 +775,70 @@ def verify_family_email_match(target_email):
         print(f"Error verifying family email: {e}")
         return False
 
+def parse_input_value(page_source, field_id):
+    """Return the value attribute of the input with the given id, read from raw HTML"""
+    for tag in re.findall(r'<input\b[^>]*>', page_source, re.IGNORECASE):
+        if re.search(rf'\bid=["\']{field_id}["\']', tag):
+            value_match = re.search(r'\bvalue=["\']([^"\']*)["\']', tag)
+            return html.unescape(value_match.group(1)) if value_match else ""
+    return None
+
+def overview_matches_email(page_source, target_email):
+    """Check the Overview email/extra_emails inputs of a family page; None when the fields are missing"""
+    primary_email = parse_input_value(page_source, "email")
+    extra_emails = parse_input_value(page_source, "extra_emails")
+    if primary_email is None and extra_emails is None:
+        return None
+    target_email = target_email.lower()
+    return (primary_email or "").strip().lower() == target_email or target_email in (extra_emails or "").lower()
+
+def find_matching_candidate(candidate_hrefs, target_email):
+    """Fetch every candidate Overview page concurrently over HTTP; returns the matching href, False if none match, None if undecidable"""
+    cookies = driver.get_cookies()
+    
+    def check(href):
+        try:
+            final_url, page_source = session_store.open_url(href, cookies)
+            return overview_matches_email(page_source, target_email)
+        except Exception as e:
+            print(f"Could not fetch candidate {href}: {e}")
+            return None
+    
+    with metrics.timer("verify_candidates"):
+        with ThreadPoolExecutor(max_workers=candidate_fetch_workers) as executor:
+            results = list(executor.map(check, candidate_hrefs))
+    
+    for href, matched in zip(candidate_hrefs, results):
+        if matched:
+            return href
+    if any(matched is None for matched in results):
+        return None
+    return False
+
 def find_correct_family_result(target_email):
+    """Find the family whose Overview emails match target_email and navigate only to the winner"""
+    candidate_hrefs = collect_result_links()
+    if not candidate_hrefs:
+        print("❌ No search results to check")
+        return False
+    
+    print(f"Checking {len(candidate_hrefs)} search results in parallel")
+    winner = find_matching_candidate(candidate_hrefs, target_email)
+    if winner:
+        print(f"✅ Found correct family: {winner}")
+        driver.get(winner)
+        time.sleep(buffer)
+        return True
+    if winner is False:
+        print("❌ Could not find family with matching email")
+        return False
+    
+    # Some candidates could not be read over HTTP - check them in the browser one by one
+    print("Parallel check was inconclusive, falling back to clicking through results")
+    metrics.increment("candidate_check_fallback")
+    return find_correct_family_result_serial(target_email)
+
+def find_correct_family_result_serial(target_email):
     """Find and click the correct family result by verifying email fields"""
     try:
         # First try searchResultItem divs
@@ -550,6 +847,9 @@ def find_correct_family_result(target_email):
             print(f"Found {len(search_result_divs)} search results to check")
             
             for i, result_div in enumerate(search_result_divs):
+                if deadline.expired():
+                    print("Time budget spent - not checking more search results")
+                    return False
                 try:
                     result_link = result_div.find_element(By.TAG_NAME, "a")
                     result_text = result_link.text.strip()
@@ -587,6 +887,9 @@ def find_correct_family_result(target_email):
             print(f"Found {len(result_rows)} table results to check")
             
             for i, row in enumerate(result_rows):
+                if deadline.expired():
+                    print("Time budget spent - not checking more table results")
+                    return False
                 try:
                     result_link = row.find_element(By.TAG_NAME, "a")
                     result_text = result_link.text.strip()
@@ -625,1131 +928,1021 @@ def find_correct_family_result(target_email):
         print(f"Error in find_correct_family_result: {e}")
         return False
 
-def process_emails():
-    global driver
+def search_studio_director(query):
+    """Navigate to the admin page and run a Studio Director search for query"""
+    trace_step("search")
+    driver.get(studio_director_admin_url)
+    time.sleep(buffer)
     
-    emails = fetch_emails()
-    print(f"Found {len(emails)} e-transfer emails to process")
+    search_field = selectors.find(driver, "admin", "search_field")
+    if not search_field:
+        print(f"Could not find search field for: {query}")
+        return False
     
-    if len(emails) == 0:
-        print("No e-transfer emails found to process")
-        return
+    search_field.clear()
+    search_field.send_keys(query)
     
-    # Keep track of processed reference numbers to avoid duplicates
-    processed_references = set()
+    search_button = selectors.find(driver, "admin", "search_button")
+    if search_button:
+        search_button.click()
+        print(f"Successfully searched for: {query}")
+    else:
+        print("Could not find search button, trying Enter key...")
+        search_field.send_keys("\n")  # Try pressing Enter
+        print(f"Tried Enter key for search: {query}")
     
-    for msg, email_id in emails:  # Unpack message and email ID
+    time.sleep(buffer)
+    return True
+
+def click_first_search_result(search_label):
+    """Click the first search result without email verification"""
+    try:
+        search_result_div = driver.find_element(By.CLASS_NAME, "searchResultItem")
+        first_result_link = search_result_div.find_element(By.TAG_NAME, "a")
+        first_result_link.click()
+        print(f"Clicked first search result from {search_label} (searchResultItem div)")
+        time.sleep(buffer)
+        return True
+    except Exception as search_error:
+        print(f"Could not find search result with {search_label}: {search_error}")
         try:
-            # Extract payment details
-            payment_date = parsedate_to_datetime(msg["Date"])
-            print(f"Payment date: {msg['Date']}")
-            
-            # Parse month, day, year for form fields
-            month_name = payment_date.strftime("%b")  # 3-letter month abbreviation
-            month_number = payment_date.month  # Numeric month for date input
-            day = payment_date.day
-            year = payment_date.year
-            print(f"Parsed month: {month_name} ({month_number}), day: {day}, year: {year}")
-            
-            # Extract sender information
-            reply_to = msg.get("Reply-To", "")
-            print(f"Original reply-to: {reply_to}")
-            
-            # Clean the email address (remove name part)
-            if "<" in reply_to and ">" in reply_to:
-                replyto_address = reply_to.split("<")[1].split(">")[0]
-            else:
-                replyto_address = reply_to
-                
-            print(f"Clean email for search: {replyto_address}")
-            
-            # Handle message body extraction for multipart messages
-            if msg.is_multipart():
-                message_body = ""
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        message_body = part.get_payload(decode=True).decode('utf-8')
-                        break
+            first_result = WebDriverWait(driver, deadline.cap(5)).until(
+                EC.element_to_be_clickable((By.XPATH, "//table[@id='accountsTable']//tr[2]//a"))
+            )
+            first_result.click()
+            print(f"Clicked first search result from {search_label} (fallback method)")
+            time.sleep(buffer)
+            return True
+        except:
+            print(f"{search_label.capitalize()} also failed to find results")
+            return False
+
+def find_family_account(transfer):
+    """Search by email, then e-transfer message, then sender name; True once a result is open"""
+    replyto_address = transfer.replyto_address
+    etransfer_message = transfer.etransfer_message
+    sender_name = transfer.sender_name
+    
+    # Try to find search results - check if email search was successful
+    search_successful = False
+    if replyto_address:
+        # Search for the sender's email address
+        if not search_studio_director(replyto_address):
+            print("Could not find search field, skipping this email")
+            return False
+        
+        try:
+            # Use the new function to find correct family by email verification
+            if find_correct_family_result(replyto_address):
+                print("✅ Found and verified correct family from email search")
+                search_successful = True
             else:
-                message_body = msg.get_payload(decode=True).decode('utf-8')
+                print("❌ Could not find family with matching email address")
+                search_successful = False
+        except Exception as search_result_error:
+            print(f"Error during email search result verification: {search_result_error}")
+            search_successful = False
+    else:
+        # Bank statement rows carry no email address
+        print("No sender email address, skipping email search")
 
-            print("=== EMAIL BODY DEBUG ===")
-            print(message_body)
-            print("========================")
+    # If email search failed and we have a message, try searching with the message
+    if not search_successful and etransfer_message:
+        deadline.check("message search")
+        print(f"Email search failed, trying to search with e-transfer message: '{etransfer_message}'")
+        if search_studio_director(etransfer_message):
+            search_successful = click_first_search_result("message search")
 
-            # Extract reference number - Updated pattern to handle alphanumeric references
-            reference_match = re.search(r'Reference Number: ([A-Za-z0-9]+)', message_body)
-            if reference_match:
-                reference_number = reference_match.group(1)
-                print(f"Found reference number using pattern 'Reference Number: ([A-Za-z0-9]+)': {reference_number}")
-                
-                # Check if we've already processed this reference number
-                if reference_number in processed_references:
-                    print(f"⚠️ Reference number {reference_number} already processed, skipping duplicate")
-                    continue
-                
-                # Add to processed set
-                processed_references.add(reference_number)
-                print(f"✅ Added {reference_number} to processed references")
-            else:
-                print("No reference number found in email")
-                continue
+    # If email and message searches failed, match the sender name against the family name index
+    if not search_successful and sender_name and sender_name != "Unknown":
+        deadline.check("sender name match")
+        print(f"Email and message searches failed, trying to match sender name: '{sender_name}'")
+        family_href = match_sender_to_family(transfer)
+        if family_href:
+            driver.get(family_href)
+            time.sleep(buffer)
+            search_successful = True
 
-            # Extract amount
-            amount_match = re.search(r'\$([0-9,]+\.?[0-9]*)', message_body)
-            if amount_match:
-                amount = amount_match.group(1)
-            else:
-                print("No amount found in email")
-                continue
+    # If all three searches failed, skip this email
+    if not search_successful:
+        print("All searches failed (email, message, and sender name), skipping this email")
+    return search_successful
 
-            # Extract sender name from the message body
-            sender_match = re.search(r'Sent From: (.+)', message_body)
-            if sender_match:
-                sender_name = sender_match.group(1).strip()
-            else:
-                sender_name = "Unknown"
+def read_ledger_state():
+    """Read the open ledger once: its URL, current balance and the notes holding the references already posted to it"""
+    ledger_url = driver.current_url
+    ledger_html = driver.page_source
+    balance_before = parse_current_balance(ledger_html)
+    print(f"Balance before payment: {balance_before}")
+    notes = extract_ledger_notes(ledger_html)
+    reference_index.set_family(ledger_url, notes)
+    print(f"Indexed {len(notes.splitlines())} ledger notes on this ledger")
+    return {"ledger_url": ledger_url, "balance_before": balance_before}
 
-            # Extract message field from the e-transfer email
-            message_match = re.search(r'Message: (.+)', message_body)
-            if message_match:
-                etransfer_message = message_match.group(1).strip()
-                print(f"Found e-transfer message: '{etransfer_message}'")
-            else:
-                etransfer_message = ""
-                print("No message found in e-transfer email")
+def open_ledger_tab():
+    """Click the Ledger tab and return the ledger URL and the balance before posting"""
+    ledger_tab = driver.find_element(By.ID, "tab-ledger")
+    ledger_tab.click()
+    print("Clicked Ledger tab")
+    time.sleep(buffer)
+    return read_ledger_state()
 
-            print(f"Processing e-transfer: ${amount} from {sender_name} <{replyto_address}>")
-            if etransfer_message:
-                print(f"E-transfer message: '{etransfer_message}'")
+def open_family_ledger():
+    """Open the family ledger from the current search result (family or student page); None on failure"""
+    trace_step("ledger")
+    # Check if we landed on a student page (no ledger tab) or family account page
+    try:
+        # We have a ledger tab, so we're on a family account page
+        return open_ledger_tab()
+    except Exception as ledger_error:
+        print(f"Could not find Ledger tab: {ledger_error}")
+        print("Looks like we're on a student page, trying to navigate to family account...")
+    
+    metrics.increment("student_page_hits")
+    with metrics.timer("student_page_to_ledger"):
+        ledger_state = jump_to_family_account()
+        if ledger_state is None:
+            deadline.check("family summary search")
+            metrics.increment("student_page_research")
+            ledger_state = research_family_from_summary()
+    return ledger_state
 
-            # Navigate to main page and search for the sender
-            driver.get("https://app.thestudiodirector.com/danceink/admin.sd")
+def jump_to_family_account():
+    """Follow the family account link on the student record straight to the family ledger"""
+    family_link = selectors.find(driver, "student", "family_link")
+    if family_link is None:
+        # The link may only be rendered once the Family tab is open
+        try:
+            driver.find_element(By.ID, "tab-family").click()
+            print("Clicked Family tab")
             time.sleep(buffer)
+            family_link = selectors.find(driver, "student", "family_link")
+        except Exception as family_tab_error:
+            print(f"Could not find Family tab: {family_tab_error}")
+    
+    family_href = family_link.get_attribute("href") if family_link else None
+    if not family_href:
+        print("No family account link on the student record")
+        return None
+    
+    try:
+        driver.get(family_href)
+        time.sleep(buffer)
+        ledger_state = open_ledger_tab()
+        print(f"✅ Jumped from student record to family ledger: {family_href}")
+        metrics.increment("student_page_direct_jump")
+        return ledger_state
+    except Exception as jump_error:
+        print(f"Family account link did not lead to a ledger: {jump_error}")
+        return None
 
-            # Search for the sender
-            search_field = None
-            # Try different selectors for the search field
-            search_selectors = [
-                (By.ID, "search"),
-                (By.NAME, "search"),
-                (By.XPATH, "//input[@type='text' and contains(@placeholder, 'search')]"),
-                (By.XPATH, "//input[@type='text']"),
-                (By.CSS_SELECTOR, "input[type='search']"),
-                (By.CSS_SELECTOR, "input.search")
-            ]
-            
-            for selector_type, selector_value in search_selectors:
-                try:
-                    search_field = driver.find_element(selector_type, selector_value)
-                    print(f"Found search field using: {selector_type}='{selector_value}'")
-                    break
-                except:
-                    continue
-                    
-            if not search_field:
-                print("Could not find search field, skipping this email")
-                continue
-                
-            search_field.clear()
-            search_field.send_keys(replyto_address)
-            
-            # Click search button
-            search_button = None
-            search_button_selectors = [
-                (By.XPATH, "//input[@value='Search']"),
-                (By.XPATH, "//button[contains(text(), 'Search')]"),
-                (By.XPATH, "//input[@type='submit']"),
-                (By.XPATH, "//button[@type='submit']"),
-                (By.CSS_SELECTOR, "input[type='submit']"),
-                (By.CSS_SELECTOR, "button[type='submit']")
-            ]
-            
-            for selector_type, selector_value in search_button_selectors:
-                try:
-                    search_button = driver.find_element(selector_type, selector_value)
-                    print(f"Found search button using: {selector_type}='{selector_value}'")
-                    break
-                except:
-                    continue
-                    
-            if search_button:
-                search_button.click()
-                print(f"Successfully searched for: {replyto_address}")
-            else:
-                print("Could not find search button, trying Enter key...")
-                search_field.send_keys("\n")  # Try pressing Enter
-                print(f"Tried Enter key for search: {replyto_address}")
-            
+def research_family_from_summary():
+    """Fallback: read the family email from the Family Summary table and search for it"""
+    # Try to click the Family tab to get family information
+    if not driver.find_elements(By.XPATH, "//table[contains(@class, 'Family Summary') or contains(text(), 'Family Summary')]"):
+        try:
+            family_tab = driver.find_element(By.ID, "tab-family")
+            family_tab.click()
+            print("Clicked Family tab")
             time.sleep(buffer)
+        except Exception as family_tab_error:
+            print(f"Could not find Family tab: {family_tab_error}")
+            return None
+    
+    # Look for Family Summary table and extract email
+    try:
+        family_summary_table = driver.find_element(By.XPATH, "//table[contains(@class, 'Family Summary') or contains(text(), 'Family Summary')]")
+        family_rows = family_summary_table.find_elements(By.TAG_NAME, 'tr')
+        
+        family_email = None
+        for row in family_rows:
+            cells = row.find_elements(By.TAG_NAME, 'td')
+            if len(cells) >= 2:
+                # Check if second cell contains an email (has @ symbol)
+                potential_email = cells[1].text.strip()
+                if '@' in potential_email:
+                    family_email = potential_email
+                    print(f"Found family email: {family_email}")
+                    break
+    except Exception as family_table_error:
+        print(f"Could not find or read Family Summary table: {family_table_error}")
+        return None
+    
+    if not family_email:
+        print("Could not find family email in Family Summary table")
+        return None
+    
+    # Search for family using the extracted email
+    print(f"Searching for family account using email: {family_email}")
+    if not search_studio_director(family_email):
+        print("Could not find search field for family email search")
+        return None
+    
+    # Try to find and click family account result with email verification
+    try:
+        if find_correct_family_result(family_email):
+            print("✅ Found and verified correct family from family email search")
+            return open_ledger_tab()
+        print("❌ Could not find family with matching family email")
+    except Exception as family_search_error:
+        print(f"Could not find/click family account: {family_search_error}")
+    return None
 
-            # Try to find search results - check if email search was successful
-            search_successful = False
-            try:
-                # Use the new function to find correct family by email verification
-                if find_correct_family_result(replyto_address):
-                    print("✅ Found and verified correct family from email search")
-                    search_successful = True
-                else:
-                    print("❌ Could not find family with matching email address")
-                    search_successful = False
-            except Exception as search_result_error:
-                print(f"Error during email search result verification: {search_result_error}")
-                search_successful = False
-
-            # If email search failed and we have a message, try searching with the message
-            if not search_successful and etransfer_message:
-                print(f"Email search failed, trying to search with e-transfer message: '{etransfer_message}'")
-                
-                # Navigate back to main page for new search
-                driver.get("https://app.thestudiodirector.com/danceink/admin.sd")
-                time.sleep(buffer)
-                
-                # Find search field again
-                search_field = None
-                for selector_type, selector_value in search_selectors:
-                    try:
-                        search_field = driver.find_element(selector_type, selector_value)
-                        print(f"Found search field for message search using: {selector_type}='{selector_value}'")
-                        break
-                    except:
-                        continue
-                
-                if search_field:
-                    search_field.clear()
-                    search_field.send_keys(etransfer_message)
-                    
-                    # Click search button for message search
-                    search_button = None
-                    for selector_type, selector_value in search_button_selectors:
-                        try:
-                            search_button = driver.find_element(selector_type, selector_value)
-                            break
-                        except:
-                            continue
-                    
-                    if search_button:
-                        search_button.click()
-                        print(f"Successfully searched for message: {etransfer_message}")
-                    else:
-                        search_field.send_keys("\n")
-                        print(f"Tried Enter key for message search: {etransfer_message}")
-                    
-                    time.sleep(buffer)
-                    
-                    # Try to find results from message search
-                    try:
-                        search_result_div = driver.find_element(By.CLASS_NAME, "searchResultItem")
-                        first_result_link = search_result_div.find_element(By.TAG_NAME, "a")
-                        first_result_link.click()
-                        print("Clicked first search result from message search (searchResultItem div)")
-                        search_successful = True
-                        time.sleep(buffer)
-                    except Exception as message_search_error:
-                        print(f"Could not find search result with message search: {message_search_error}")
-                        try:
-                            first_result = WebDriverWait(driver, 5).until(
-                                EC.element_to_be_clickable((By.XPATH, "//table[@id='accountsTable']//tr[2]//a"))
-                            )
-                            first_result.click()
-                            print("Clicked first search result from message search (fallback method)")
-                            search_successful = True
-                            time.sleep(buffer)
-                        except:
-                            print("Message search also failed to find results")
-                            search_successful = False
-
-            # If email and message searches failed, try sender name as third fallback
-            if not search_successful and sender_name and sender_name != "Unknown":
-                print(f"Email and message searches failed, trying to search with sender name: '{sender_name}'")
-                
-                # Navigate back to main page for sender name search
-                driver.get("https://app.thestudiodirector.com/danceink/admin.sd")
-                time.sleep(buffer)
-                
-                # Find search field again
-                search_field = None
-                for selector_type, selector_value in search_selectors:
-                    try:
-                        search_field = driver.find_element(selector_type, selector_value)
-                        print(f"Found search field for sender name search using: {selector_type}='{selector_value}'")
-                        break
-                    except:
-                        continue
-                
-                if search_field:
-                    search_field.clear()
-                    search_field.send_keys(sender_name)
-                    
-                    # Click search button for sender name search
-                    search_button = None
-                    for selector_type, selector_value in search_button_selectors:
-                        try:
-                            search_button = driver.find_element(selector_type, selector_value)
-                            break
-                        except:
-                            continue
-                    
-                    if search_button:
-                        search_button.click()
-                        print(f"Successfully searched for sender name: {sender_name}")
-                    else:
-                        search_field.send_keys("\n")
-                        print(f"Tried Enter key for sender name search: {sender_name}")
-                    
-                    time.sleep(buffer)
-                    
-                    # Try to find results from sender name search
-                    try:
-                        search_result_div = driver.find_element(By.CLASS_NAME, "searchResultItem")
-                        first_result_link = search_result_div.find_element(By.TAG_NAME, "a")
-                        first_result_link.click()
-                        print("Clicked first search result from sender name search (searchResultItem div)")
-                        search_successful = True
-                        time.sleep(buffer)
-                    except Exception as sender_search_error:
-                        print(f"Could not find search result with sender name search: {sender_search_error}")
-                        try:
-                            first_result = WebDriverWait(driver, 5).until(
-                                EC.element_to_be_clickable((By.XPATH, "//table[@id='accountsTable']//tr[2]//a"))
-                            )
-                            first_result.click()
-                            print("Clicked first search result from sender name search (fallback method)")
-                            search_successful = True
-                            time.sleep(buffer)
-                        except:
-                            print("Sender name search also failed to find results")
-                            search_successful = False
-
-            # If all three searches failed, skip this email
-            if not search_successful:
-                print("All searches failed (email, message, and sender name), skipping this email")
-                continue
+def reopen_ledger(ledger_url):
+    """Go straight back to a ledger recorded in the journal; True when a payment can be added there"""
+    try:
+        driver.get(ledger_url)
+        time.sleep(buffer)
+        return bool(driver.find_elements(By.ID, "addnewpayment"))
+    except Exception as e:
+        print(f"Could not reopen ledger {ledger_url}: {e}")
+        return False
 
-            # Check if we landed on a student page (no ledger tab) or family account page
-            try:
-                ledger_tab = driver.find_element(By.ID, "tab-ledger")
-                # We have a ledger tab, so we're on a family account page
-                ledger_tab.click()
-                print("Clicked Ledger tab")
-                time.sleep(buffer)
-                
-                # We'll parse unpaid charges later after clicking "Cash, check, trade"
-                # For now, just set defaults
-                payment_category = "Tuition"  # Will be updated after parsing charges
-                payment_amount_to_use = amount  # Will be updated after allocation calculation
-                all_allocations = []  # Will be populated after parsing
-                    
-            except Exception as ledger_error:
-                print(f"Could not find Ledger tab: {ledger_error}")
-                print("Looks like we're on a student page, trying to navigate to family account...")
-                
-                # Try to click the Family tab to get family information
-                try:
-                    family_tab = driver.find_element(By.ID, "tab-family")
-                    family_tab.click()
-                    print("Clicked Family tab")
-                    time.sleep(buffer)
-                    
-                    # Look for Family Summary table and extract email
-                    try:
-                        family_summary_table = driver.find_element(By.XPATH, "//table[contains(@class, 'Family Summary') or contains(text(), 'Family Summary')]")
-                        family_rows = family_summary_table.find_elements(By.TAG_NAME, 'tr')
-                        
-                        family_email = None
-                        for row in family_rows:
-                            cells = row.find_elements(By.TAG_NAME, 'td')
-                            if len(cells) >= 2:
-                                # Check if second cell contains an email (has @ symbol)
-                                potential_email = cells[1].text.strip()
-                                if '@' in potential_email:
-                                    family_email = potential_email
-                                    print(f"Found family email: {family_email}")
-                                    break
-                        
-                        if family_email:
-                            print(f"Searching for family account using email: {family_email}")
-                            
-                            # Navigate back to main page for family search
-                            driver.get("https://app.thestudiodirector.com/danceink/admin.sd")
-                            time.sleep(buffer)
-                            
-                            # Search for family using the extracted email
-                            search_field = None
-                            for selector_type, selector_value in search_selectors:
-                                try:
-                                    search_field = driver.find_element(selector_type, selector_value)
-                                    break
-                                except:
-                                    continue
-                            
-                            if search_field:
-                                search_field.clear()
-                                search_field.send_keys(family_email)
-                                
-                                # Click search button
-                                search_button = None
-                                for selector_type, selector_value in search_button_selectors:
-                                    try:
-                                        search_button = driver.find_element(selector_type, selector_value)
-                                        break
-                                    except:
-                                        continue
-                                
-                                if search_button:
-                                    search_button.click()
-                                    print(f"Successfully searched for family email: {family_email}")
-                                else:
-                                    search_field.send_keys("\n")
-                                    print(f"Tried Enter key for family email search: {family_email}")
-                                
-                                time.sleep(buffer)
-                                
-                                # Try to find and click family account result with email verification
-                                try:
-                                    if find_correct_family_result(family_email):
-                                        print("✅ Found and verified correct family from family email search")
-                                        
-                                        # Now try to click the Ledger tab on the family account
-                                        ledger_tab = driver.find_element(By.ID, "tab-ledger")
-                                        ledger_tab.click()
-                                        print("Clicked Ledger tab on family account")
-                                        time.sleep(buffer)
-                                        
-                                        # Set payment category to default since we're now on family account
-                                        payment_category = "Tuition"
-                                        print("Set payment category to Tuition (family account)")
-                                    else:
-                                        print("❌ Could not find family with matching family email")
-                                        payment_category = "Tuition"
-                                    
-                                except Exception as family_search_error:
-                                    print(f"Could not find/click family account: {family_search_error}")
-                                    print("Using default Tuition category and continuing...")
-                                    payment_category = "Tuition"
-                            else:
-                                print("Could not find search field for family email search")
-                                payment_category = "Tuition"
-                        else:
-                            print("Could not find family email in Family Summary table")
-                            payment_category = "Tuition"
-                            
-                    except Exception as family_table_error:
-                        print(f"Could not find or read Family Summary table: {family_table_error}")
-                        payment_category = "Tuition"
-                        
-                except Exception as family_tab_error:
-                    print(f"Could not find Family tab: {family_tab_error}")
-                    payment_category = "Tuition"  # Default fallback
-                    print("Using default Tuition category")
+def open_payment_form():
+    """Open a new cash payment on the current ledger; True once the form is showing"""
+    # Click the Add New Payment button
+    try:
+        add_payment_button = driver.find_element(By.ID, "addnewpayment")
+        add_payment_button.click()
+        print("Clicked Add New Payment button")
+        time.sleep(buffer)
+    except Exception as add_payment_error:
+        print(f"Could not find Add New Payment button: {add_payment_error}")
+        print("Skipping this email")
+        return None
 
-            # Click the Add New Payment button
-            try:
-                add_payment_button = driver.find_element(By.ID, "addnewpayment")
-                add_payment_button.click()
-                print("Clicked Add New Payment button")
-                time.sleep(buffer)
-            except Exception as add_payment_error:
-                print(f"Could not find Add New Payment button: {add_payment_error}")
-                print("Skipping this email")
-                continue
+    # After clicking Add New Payment, click the "Cash, check, trade" link
+    try:
+        cash_check_trade_link = driver.find_element(By.XPATH, "//a[contains(text(), 'Cash, check, trade')]")
+        cash_check_trade_link.click()
+        print("Clicked 'Cash, check, trade' link")
+        time.sleep(buffer)
+    except Exception as cash_link_error:
+        print(f"Could not find 'Cash, check, trade' link: {cash_link_error}")
+        # Try alternative selectors
+        try:
+            cash_link_alt = driver.find_element(By.XPATH, "//a[contains(text(), 'Cash')]")
+            cash_link_alt.click()
+            print("Clicked cash link (alternative)")
+            time.sleep(buffer)
+        except:
+            print("Could not find any cash/check/trade link, skipping this email")
+            return False
+    return True
 
-            # After clicking Add New Payment, click the "Cash, check, trade" link
-            try:
-                cash_check_trade_link = driver.find_element(By.XPATH, "//a[contains(text(), 'Cash, check, trade')]")
-                cash_check_trade_link.click()
-                print("Clicked 'Cash, check, trade' link")
-                time.sleep(buffer)
-            except Exception as cash_link_error:
-                print(f"Could not find 'Cash, check, trade' link: {cash_link_error}")
-                # Try alternative selectors
-                try:
-                    cash_link_alt = driver.find_element(By.XPATH, "//a[contains(text(), 'Cash')]")
-                    cash_link_alt.click()
-                    print("Clicked cash link (alternative)")
-                    time.sleep(buffer)
-                except:
-                    print("Could not find any cash/check/trade link, skipping this email")
-                    continue
+def read_unpaid_charges(ledger_state, mirrored_charges=None):
+    """Unpaid charges on the open payment form; mirrored charges (looked up before the form was opened) only need confirming"""
+    ledger_url = ledger_state["ledger_url"]
+    balance_before = ledger_state["balance_before"]
+    if mirrored_charges is not None:
+        # One page_source read confirms the mirror instead of the settle wait and the element-by-element scan
+        if parse_unpaid_charges_html(driver.page_source) == mirrored_charges:
+            print(f"✅ Unpaid charges confirmed from local mirror: {mirrored_charges}")
+            metrics.increment("unpaid_charges.mirror_hit")
+            return mirrored_charges
+        print("Mirrored unpaid charges differ from the form, reading them again")
+        metrics.increment("unpaid_charges.mirror_stale")
+    
+    # Parse unpaid charges after "Cash, check, trade" is clicked
+    print("Parsing unpaid charges after clicking 'Cash, check, trade'...")
+    time.sleep(2)  # Give extra time for page to load with charge details
+    
+    unpaid_charges = parse_unpaid_charges(driver)
+    metrics.increment("unpaid_charges.fetched")
+    charge_mirror.replace(ledger_url, unpaid_charges, balance_before)
+    return unpaid_charges
 
-            # NOW parse unpaid charges and calculate payment allocation (after "Cash, check, trade" is clicked)
-            print("Parsing unpaid charges after clicking 'Cash, check, trade'...")
-            time.sleep(2)  # Give extra time for page to load with charge details
-            
-            unpaid_charges = parse_unpaid_charges(driver)
-            payment_allocations = calculate_payment_allocation(amount, unpaid_charges)
-            
-            print(f"Payment allocations calculated: {payment_allocations}")
-            
-            # Update payment details based on parsed charges
-            if payment_allocations:
-                # For multiple allocations, we need to handle split payments differently
-                if len(payment_allocations) > 1:
-                    print(f"Multiple allocations detected: {payment_allocations}")
-                    # Use the full payment amount for the form
-                    payment_amount_to_use = amount
-                    # We'll handle the splits after clicking Split Payment button
-                else:
-                    # Single allocation
-                    payment_category = payment_allocations[0][0]  # Get the category from first allocation
-                    payment_amount_to_use = payment_allocations[0][1]  # Get the amount
-                    print(f"Single allocation: ${payment_amount_to_use} to {payment_category}")
-            else:
-                payment_category = "Tuition"  # Default fallback
-                payment_amount_to_use = amount
-                print("No allocations calculated, using default Tuition")
-                
-            # Store all allocations for processing splits
-            all_allocations = payment_allocations
+def fill_payment_form(transfer, ledger_state):
+    """Open a new cash payment on the current ledger and fill it; returns (unpaid charges, allocations), None if the form did not open or False if the split rows could not be filled"""
+    amount = transfer.amount
+    reference_number = transfer.reference_number
+    
+    # While the ledger balance is unchanged the mirror holds the charges, so the allocation is known before any navigation
+    mirrored_charges = charge_mirror.get(ledger_state["ledger_url"], ledger_state["balance_before"])
+    if mirrored_charges is not None:
+        payment_allocations = calculate_payment_allocation(amount, mirrored_charges)
+    
+    trace_step("payment_form")
+    if not open_payment_form():
+        return None
+    
+    unpaid_charges = read_unpaid_charges(ledger_state, mirrored_charges)
+    if mirrored_charges is None or unpaid_charges != mirrored_charges:
+        # No usable mirror: calculate the allocation from the charges just read off the form
+        payment_allocations = calculate_payment_allocation(amount, unpaid_charges)
+    
+    print(f"Payment allocations calculated: {payment_allocations}")
+    
+    # Update payment details based on parsed charges
+    if payment_allocations:
+        # For multiple allocations, we need to handle split payments differently
+        if len(payment_allocations) > 1:
+            print(f"Multiple allocations detected: {payment_allocations}")
+            # Use the full payment amount for the form
+            payment_amount_to_use = amount
+            # We'll handle the splits after clicking Split Payment button
+        else:
+            # Single allocation
+            payment_category = payment_allocations[0][0]  # Get the category from first allocation
+            payment_amount_to_use = payment_allocations[0][1]  # Get the amount
+            print(f"Single allocation: ${payment_amount_to_use} to {payment_category}")
+    else:
+        payment_amount_to_use = amount
+        print("No allocations calculated, using default Tuition")
+        
+    # Store all allocations for processing splits
+    all_allocations = payment_allocations
 
-            # Set payment amount (using calculated allocation amount)
-            amount_field = driver.find_element(By.NAME, "amount")
-            amount_field.clear()
-            amount_field.send_keys(str(payment_amount_to_use))
-            print(f"Successfully set payment amount: ${payment_amount_to_use}")
+    # Set payment amount (using calculated allocation amount)
+    amount_field = driver.find_element(By.NAME, "amount")
+    amount_field.clear()
+    amount_field.send_keys(str(payment_amount_to_use))
+    print(f"Successfully set payment amount: ${payment_amount_to_use}")
 
-            # Set reference in notes field (since there's no dedicated reference field)
-            try:
-                notes_field = driver.find_element(By.CSS_SELECTOR, '[name="notes"]')
-                notes_field.clear()
-                notes_field.send_keys(f"{reference_number}")
-                print(f"Successfully set reference in notes field: {reference_number}")
-            except Exception as e:
-                print(f"Could not find notes field: {e}")
+    # Set reference in notes field (since there's no dedicated reference field)
+    try:
+        notes_field = driver.find_element(By.CSS_SELECTOR, '[name="notes"]')
+        notes_field.clear()
+        notes_field.send_keys(f"{reference_number}")
+        print(f"Successfully set reference in notes field: {reference_number}")
+    except Exception as e:
+        print(f"Could not find notes field: {e}")
+    
+    # Set payment date using the correct field names - these are date input fields
+    # Format date as YYYY-MM-DD for HTML date input
+    formatted_date = transfer.date.isoformat()
+    try:
+        # Set due_date field
+        due_date_field = driver.find_element(By.NAME, "due_date")
+        due_date_field.clear()
+        due_date_field.send_keys(formatted_date)
+        print(f"✅ Successfully set due_date: {formatted_date}")
+        
+    except Exception as date_error:
+        print(f"Error setting due_date: {date_error}")
+        
+        # Try alternative method with deposit_date
+        try:
+            deposit_date_field = driver.find_element(By.NAME, "deposit_date")
+            deposit_date_field.clear()
+            deposit_date_field.send_keys(formatted_date)
+            print(f"✅ Successfully set deposit_date: {formatted_date}")
+        except Exception as deposit_date_error:
+            print(f"Could not set deposit_date either: {deposit_date_error}")
             
-            # Set payment date using the correct field names - these are date input fields
+            # Debug: List all select elements to find date fields
             try:
-                # Format date as YYYY-MM-DD for HTML date input
-                formatted_date = f"{year}-{month_number:02d}-{day:02d}"
-                
-                # Set due_date field
-                due_date_field = driver.find_element(By.NAME, "due_date")
-                due_date_field.clear()
-                due_date_field.send_keys(formatted_date)
-                print(f"✅ Successfully set due_date: {formatted_date}")
-                
-            except Exception as date_error:
-                print(f"Error setting due_date: {date_error}")
-                
-                # Try alternative method with deposit_date
-                try:
-                    formatted_date = f"{year}-{month_number:02d}-{day:02d}"
-                    deposit_date_field = driver.find_element(By.NAME, "deposit_date")
-                    deposit_date_field.clear()
-                    deposit_date_field.send_keys(formatted_date)
-                    print(f"✅ Successfully set deposit_date: {formatted_date}")
-                except Exception as deposit_date_error:
-                    print(f"Could not set deposit_date either: {deposit_date_error}")
-                    
-                    # Debug: List all select elements to find date fields
-                    try:
-                        all_selects = driver.find_elements(By.TAG_NAME, "select")
-                        print(f"Available select fields on page:")
-                        for select_field in all_selects:
-                            name = select_field.get_attribute("name") or "no name"
-                            select_id = select_field.get_attribute("id") or "no id"
-                            if name != "no name" or select_id != "no id":
-                                print(f"  Select: name='{name}', id='{select_id}'")
-                    except:
-                        pass
+                all_selects = driver.find_elements(By.TAG_NAME, "select")
+                print(f"Available select fields on page:")
+                for select_field in all_selects:
+                    name = select_field.get_attribute("name") or "no name"
+                    select_id = select_field.get_attribute("id") or "no id"
+                    if name != "no name" or select_id != "no id":
+                        print(f"  Select: name='{name}', id='{select_id}'")
+            except:
+                pass
 
-            # Try to set payment method if available
+    # Try to set payment method if available
+    try:
+        # Look for method field - it might be a select or input
+        method_selectors = [
+            '[name="method"]',
+            '[name="payment_method"]', 
+            '[id="method"]',
+            '[id="payment_method"]',  # Added this selector
+            'select[name*="method"]'
+        ]
+        
+        method_field = None
+        for selector in method_selectors:
             try:
-                # Look for method field - it might be a select or input
-                method_selectors = [
-                    '[name="method"]',
-                    '[name="payment_method"]', 
-                    '[id="method"]',
-                    '[id="payment_method"]',  # Added this selector
-                    'select[name*="method"]'
-                ]
-                
-                method_field = None
-                for selector in method_selectors:
+                method_field = driver.find_element(By.CSS_SELECTOR, selector)
+                print(f"Found method field with selector: {selector}")
+                break
+            except:
+                continue
+        
+        if method_field:
+            if method_field.tag_name == 'select':
+                method_select = Select(method_field)
+                # Try different method values for e-transfer (EFT first)
+                method_options = ["EFT", "eTransfer", "Electronic", "Bank Transfer"]
+                for method_option in method_options:
                     try:
-                        method_field = driver.find_element(By.CSS_SELECTOR, selector)
-                        print(f"Found method field with selector: {selector}")
+                        method_select.select_by_visible_text(method_option)
+                        print(f"Selected payment method: {method_option}")
                         break
                     except:
                         continue
-                
-                if method_field:
-                    if method_field.tag_name == 'select':
-                        method_select = Select(method_field)
-                        # Try different method values for e-transfer (EFT first)
-                        method_options = ["EFT", "eTransfer", "Electronic", "Bank Transfer"]
-                        for method_option in method_options:
-                            try:
-                                method_select.select_by_visible_text(method_option)
-                                print(f"Selected payment method: {method_option}")
-                                break
-                            except:
-                                continue
-                    else:
-                        method_field.clear()
-                        method_field.send_keys("EFT")  # Use EFT instead of eTransfer
-                        print("Set payment method to EFT")
-                else:
-                    print("Could not find payment method field")
-                    
-            except Exception as method_error:
-                print(f"Error setting payment method: {method_error}")
-            
-            # Handle split payments based on payment allocations
-            print(f"Processing payment allocations: {all_allocations}")
-            
-            # Determine if we need split payments
-            if all_allocations and len(all_allocations) > 1:
-                print(f"Multiple categories detected - setting up split payments for {len(all_allocations)} categories")
-                
-                # Click Split Payment button multiple times to reveal all needed fields
-                # Each click reveals one additional split pair (split_amt + paid_toward)
-                # We need (len(all_allocations) - 1) clicks since the first pair is already visible
-                clicks_needed = len(all_allocations) - 1
-                print(f"Need to click Split Payment button {clicks_needed} times to reveal all fields")
-                
-                try:
-                    for click_num in range(clicks_needed):
-                        split_payment_button = driver.find_element(By.ID, 'splitpayment')
-                        split_payment_button.click()
-                        print(f"Clicked Split Payment button #{click_num + 1} of {clicks_needed}")
-                        time.sleep(buffer)
-                        
-                        # Check if the expected field is now available
-                        expected_field_num = click_num + 2  # After first click, we expect split_amt2, etc.
-                        expected_field_name = f"split_amt{expected_field_num}"
-                        try:
-                            driver.find_element(By.NAME, expected_field_name)
-                            print(f"✅ {expected_field_name} is now available")
-                        except:
-                            print(f"⚠️ {expected_field_name} not found after clicking")
-                    
-                    print("All Split Payment button clicks completed")
-                    
-                    # Process each allocation
-                    for i, (category, allocation_amount) in enumerate(all_allocations):
-                        field_number = i + 1  # paid_toward1, paid_toward2, etc.
-                        
-                        # Use the correct split amount field name
-                        amount_field_name = f"split_amt{field_number}"
-                        category_field_name = f"paid_toward{field_number}"
-                        
-                        print(f"Setting allocation {field_number}: ${allocation_amount} to {category}")
-                        
-                        # Check for any existing alerts before starting
-                        try:
-                            alert = driver.switch_to.alert
-                            alert_text = alert.text
-                            print(f"⚠️ Pre-existing alert found: {alert_text}")
-                            alert.accept()
-                            print("Pre-existing alert dismissed")
-                            time.sleep(0.5)  # Wait after dismissing alert
-                        except:
-                            pass  # No alert, which is normal
-                        
-                        # Set the amount for this split
-                        try:
-                            # First, verify the field exists
-                            split_amount_field = driver.find_element(By.NAME, amount_field_name)
-                            print(f"✅ Found {amount_field_name} field")
-                            
-                            # Clear the field first
-                            split_amount_field.clear()
-                            print(f"Cleared {amount_field_name}")
-                            
-                            # Wait a moment for any validation to complete
-                            time.sleep(0.5)
-                            
-                            # Set the allocation amount (ensure it's formatted properly)
-                            amount_str = f"{allocation_amount:.2f}"
-                            split_amount_field.send_keys(amount_str)
-                            print(f"✅ Set {amount_field_name} to ${amount_str}")
-                            
-                            # Immediately verify the value was set correctly
-                            time.sleep(0.2)
-                            actual_value = split_amount_field.get_attribute("value")
-                            print(f"Verification: {amount_field_name} contains: '{actual_value}'")
-                            
-                            # Check for alerts immediately after setting value
-                            alert_handled = False
-                            for attempt in range(3):  # Try up to 3 times to handle alerts
-                                try:
-                                    alert = driver.switch_to.alert
-                                    alert_text = alert.text
-                                    print(f"⚠️ Alert #{attempt + 1} appeared: {alert_text}")
-                                    alert.accept()
-                                    print(f"Alert #{attempt + 1} dismissed")
-                                    alert_handled = True
-                                    time.sleep(0.5)  # Wait after dismissing alert
-                                    
-                                    # Re-verify field value after alert
-                                    current_value = split_amount_field.get_attribute("value")
-                                    print(f"Field {amount_field_name} value after alert #{attempt + 1}: '{current_value}'")
-                                    
-                                    # If value was cleared by alert, re-set it
-                                    if current_value != amount_str and current_value == "":
-                                        print(f"Alert cleared the field! Re-setting {amount_field_name} to ${amount_str}")
-                                        split_amount_field.clear()
-                                        split_amount_field.send_keys(amount_str)
-                                        time.sleep(0.3)
-                                    
-                                except:
-                                    break  # No more alerts
-                            
-                            if alert_handled:
-                                print(f"Finished handling alerts for {amount_field_name}")
-                            else:
-                                print(f"No alerts appeared for {amount_field_name}")
-                                
-                            # Final verification after all alert handling
-                            final_value = split_amount_field.get_attribute("value")
-                            print(f"Final verification: {amount_field_name} = '{final_value}'")
-                            
-                            if final_value != amount_str:
-                                print(f"❌ Final value mismatch for {amount_field_name}! Expected: {amount_str}, Got: {final_value}")
-                                # One more attempt to correct
-                                split_amount_field.clear()
-                                split_amount_field.send_keys(amount_str)
-                                print(f"Made final correction attempt for {amount_field_name}")
-                            else:
-                                print(f"✅ {amount_field_name} value confirmed: ${final_value}")
-                                
-                        except Exception as amount_error:
-                            print(f"❌ Could not find amount field {amount_field_name}: {amount_error}")
-                            
-                            # Debug: List available split amount fields
-                            try:
-                                print(f"Looking for available split amount fields...")
-                                for field_num in range(1, 6):  # Check split_amt1 through split_amt5
-                                    test_field_name = f"split_amt{field_num}"
-                                    try:
-                                        test_field = driver.find_element(By.NAME, test_field_name)
-                                        print(f"  ✅ {test_field_name} exists")
-                                    except:
-                                        print(f"  ❌ {test_field_name} not found")
-                            except:
-                                pass
-                                
-                            # Check for alert in case of error
-                            try:
-                                alert = driver.switch_to.alert
-                                alert_text = alert.text
-                                print(f"⚠️ Alert appeared during amount setting: {alert_text}")
-                                alert.accept()  # Dismiss the alert
-                                print("Alert dismissed")
-                            except:
-                                pass
-                                
-                            # List all input fields to debug
-                            try:
-                                all_inputs = driver.find_elements(By.TAG_NAME, "input")
-                                print(f"Available input fields on page:")
-                                for input_field in all_inputs[:20]:  # Limit to first 20 to avoid spam
-                                    name = input_field.get_attribute("name") or "no name"
-                                    field_type = input_field.get_attribute("type") or "no type"
-                                    if name != "no name":
-                                        print(f"  Input: name='{name}', type='{field_type}'")
-                            except:
-                                pass
-                        
-                        # Set the category for this split
-                        try:
-                            category_select = Select(driver.find_element(By.NAME, category_field_name))
-                            
-                            # Get available options
-                            all_options = category_select.options
-                            available_options = [(opt.get_attribute('value'), opt.text) for opt in all_options]
-                            print(f"Available options for {category_field_name}: {[text for value, text in available_options]}")
-                            
-                            # Try to find the matching category
-                            selection_successful = False
-                            
-                            # First try exact match by visible text
-                            try:
-                                category_select.select_by_visible_text(category)
-                                print(f"✅ Selected '{category}' by exact text for {category_field_name}")
-                                selection_successful = True
-                            except Exception as exact_error:
-                                print(f"Exact text match failed for '{category}': {exact_error}")
-                            
-                            # If exact match failed, try by value
-                            if not selection_successful:
-                                for value, text in available_options:
-                                    if text == category:
-                                        try:
-                                            category_select.select_by_value(value)
-                                            print(f"✅ Selected '{category}' by value '{value}' for {category_field_name}")
-                                            selection_successful = True
-                                            break
-                                        except Exception as value_error:
-                                            print(f"Value selection failed for '{value}': {value_error}")
-                                            continue
-                            
-                            # If still not successful, try partial matching
-                            if not selection_successful:
-                                print(f"Trying partial matching for '{category}'...")
-                                for value, text in available_options:
-                                    if category.lower() in text.lower() or text.lower() in category.lower():
-                                        try:
-                                            category_select.select_by_value(value)
-                                            print(f"✅ Selected '{category}' option for {category_field_name}: '{value}' ('{text}')")
-                                            selection_successful = True
-                                            break
-                                        except Exception as select_error:
-                                            print(f"Partial match selection failed for '{value}': {select_error}")
-                                            continue
-                            
-                            # If direct match failed, try partial matches
-                            if not selection_successful:
-                                if "tuition" in category.lower():
-                                    for value, text in available_options:
-                                        if "tuition" in text.lower():
-                                            try:
-                                                category_select.select_by_value(value)
-                                                print(f"Selected Tuition option for {category_field_name}: '{value}' ('{text}')")
-                                                selection_successful = True
-                                                break
-                                            except:
-                                                continue
-                                elif "costume" in category.lower():
-                                    for value, text in available_options:
-                                        if "costume" in text.lower():
-                                            try:
-                                                category_select.select_by_value(value)
-                                                print(f"Selected Costume option for {category_field_name}: '{value}' ('{text}')")
-                                                selection_successful = True
-                                                break
-                                            except:
-                                                continue
-                                elif "private" in category.lower():
-                                    for value, text in available_options:
-                                        if "private" in text.lower() or "lesson" in text.lower():
-                                            try:
-                                                category_select.select_by_value(value)
-                                                print(f"Selected Private Lesson option for {category_field_name}: '{value}' ('{text}')")
-                                                selection_successful = True
-                                                break
-                                            except:
-                                                continue
-                            
-                            if not selection_successful:
-                                print(f"⚠️ Could not find matching option for category: {category}")
-                                
-                        except Exception as category_error:
-                            print(f"Error setting category for {category_field_name}: {category_error}")
-                    
-                    # Final verification: Check all split amounts are set correctly
-                    print("=== Final Split Amount Verification ===")
-                    for i, (category, expected_amount) in enumerate(all_allocations):
-                        field_number = i + 1
-                        amount_field_name = f"split_amt{field_number}"
-                        try:
-                            split_field = driver.find_element(By.NAME, amount_field_name)
-                            actual_value = split_field.get_attribute("value")
-                            expected_str = f"{expected_amount:.2f}"
-                            
-                            if actual_value == expected_str:
-                                print(f"✅ {amount_field_name}: Expected ${expected_str}, Got ${actual_value}")
-                            else:
-                                print(f"❌ {amount_field_name}: Expected ${expected_str}, Got ${actual_value}")
-                                print(f"Attempting to correct {amount_field_name}...")
-                                split_field.clear()
-                                split_field.send_keys(expected_str)
-                                print(f"Corrected {amount_field_name} to ${expected_str}")
-                                
-                        except Exception as verify_error:
-                            print(f"Could not verify {amount_field_name}: {verify_error}")
-                    print("=== End Verification ===")
-                    
-                except Exception as multi_split_error:
-                    print(f"Error setting up multiple split payments: {multi_split_error}")
-                    
-            elif all_allocations and len(all_allocations) == 1:
-                # Single allocation - use traditional split payment method
-                payment_category = all_allocations[0][0]
-                print(f"Single allocation: Using {payment_category} for split payment")
-                
-                if payment_category == "Private Lesson":
-                    split_category = "Private Lesson"
-                    print("Will split payment as Private Lesson")
-                else:
-                    split_category = "Tuition"
-                    print("Will split payment as Tuition")
-                
-                # BEFORE saving: Click Split Payment button to make paid_toward1 visible
-                try:
-                    split_payment_button = driver.find_element(By.ID, 'splitpayment')
-                    split_payment_button.click()
-                    print("Clicked Split Payment button for single allocation")
-                    time.sleep(buffer)
-                    
-                    # Set the split payment category in the SELECT dropdown
-                    try:
-                        paid_toward_select = Select(driver.find_element(By.NAME, 'paid_toward1'))
-                        
-                        # Get available options for selection logic
-                        all_options = paid_toward_select.options
-                        available_options = [(opt.get_attribute('value'), opt.text) for opt in all_options]
-                        
-                        # Try different selection methods based on the split_category
-                        selection_successful = False
-                        
-                        if split_category == "Private Lesson":
-                            # Try to find Private Lesson option
-                            for value, text in available_options:
-                                if "Private" in text or "private" in text or "lesson" in text.lower():
-                                    try:
-                                        paid_toward_select.select_by_value(value)
-                                        print(f"Selected Private Lesson option: {value} ({text})")
-                                        selection_successful = True
-                                        break
-                                    except:
-                                        continue
-                        
-                        if not selection_successful and split_category == "Tuition":
-                            # Try to find Tuition option
-                            for value, text in available_options:
-                                if "Tuition" in text or "tuition" in text:
-                                    try:
-                                        paid_toward_select.select_by_value(value)
-                                        print(f"Selected Tuition option: {value} ({text})")
-                                        selection_successful = True
-                                        break
-                                    except:
-                                        continue
-                        
-                        # If still not successful, try exact match
-                        if not selection_successful:
-                            try:
-                                paid_toward_select.select_by_visible_text(split_category)
-                                print(f"Selected by visible text: {split_category}")
-                                selection_successful = True
-                            except:
-                                try:
-                                    paid_toward_select.select_by_value(split_category)
-                                    print(f"Selected by value: {split_category}")
-                                    selection_successful = True
-                                except:
-                                    pass
-                        
-                        if not selection_successful:
-                            print(f"Could not select any option for category: {split_category}")
-                            
-                    except Exception as split_error:
-                        print(f"Error setting split payment category: {split_error}")
-                        
-                except Exception as split_button_error:
-                    print(f"Error clicking Split Payment button: {split_button_error}")
             else:
-                print("No valid allocations - skipping split payment setup")
+                method_field.clear()
+                method_field.send_keys("EFT")  # Use EFT instead of eTransfer
+                print("Set payment method to EFT")
+        else:
+            print("Could not find payment method field")
             
-            # NOW save the payment (with split category already set)
-            print("Looking for save/submit button...")
-            try:
-                save_button = driver.find_element(By.ID, "savepayment")
-                print("Found save button with ID: savepayment")
-                if not safe_mode:
-                    save_button.click()
-                    print("Successfully clicked save button")
-                    time.sleep(buffer)  # Wait for save to complete
-                else:
-                    print("SAFE MODE: Skipping save button click")
-            except Exception as save_error:
-                print(f"Could not find save button with ID 'savepayment': {save_error}")
-                # Fallback to other selectors
-                save_selectors = [
-                    'input[type="submit"]',
-                    'button[type="submit"]', 
-                    'input[value*="Save"]',
-                    'button[value*="Save"]',
-                    'input[value*="Add"]',
-                    'button[value*="Add"]',
-                    '.save-btn',
-                    '#save-payment',
-                    '[name="save"]',
-                    '[name="submit"]'
-                ]
-                
-                save_button = None
-                for selector in save_selectors:
-                    try:
-                        save_button = driver.find_element(By.CSS_SELECTOR, selector)
-                        print(f"Found save button with selector: {selector}")
-                        break
-                    except:
-                        continue
-                
-                if save_button:
-                    try:
-                        if not safe_mode:
-                            save_button.click()
-                            print("Successfully clicked save button (fallback)")
-                            time.sleep(buffer)  # Wait for save to complete
-                        else:
-                            print("SAFE MODE: Skipping save button click (fallback)")
-                    except Exception as e:
-                        print(f"Error clicking save button: {e}")
-                else:
-                    print("Could not find save button - payment form filled but not submitted")
+    except Exception as method_error:
+        print(f"Error setting payment method: {method_error}")
+    
+    # Handle split payments based on payment allocations
+    print(f"Processing payment allocations: {all_allocations}")
+    
+    if all_allocations and len(all_allocations) > 1:
+        print(f"Multiple categories detected - setting up split payments for {len(all_allocations)} categories")
+        try:
+            if not fill_split_payment(all_allocations):
+                print("❌ Split rows could not be verified - not saving this payment")
+                return False
+            print("✅ All split rows set and verified")
+        except Exception as multi_split_error:
+            print(f"Error setting up multiple split payments: {multi_split_error}")
+            return False
             
-            print("Payment processing completed for this e-transfer")
+    elif all_allocations and len(all_allocations) == 1:
+        # Single allocation - only paid_toward1 is needed, the amount field carries the total
+        payment_category = all_allocations[0][0]
+        split_category = "Private Lesson" if payment_category == "Private Lesson" else "Tuition"
+        print(f"Single allocation: Will split payment as {split_category}")
+        try:
+            if not fill_split_payment([(split_category, payment_amount_to_use)], set_amounts=False):
+                print(f"❌ Could not select the option for category {split_category} - not saving this payment")
+                return False
+        except Exception as split_error:
+            print(f"Error setting split payment category: {split_error}")
+            return False
+    else:
+        print("No valid allocations - skipping split payment setup")
+    
+    return unpaid_charges, all_allocations
 
-            # After saving payment, look for "Review the account ledger" link and click it
-            try:
-                # Wait a moment for the page to update after saving
-                time.sleep(buffer)
-                
-                # Look for the "Review the account ledger" link in the specific location:
-                # <a> tag inside the last <p> tag inside the div with class="contentInfo"
-                review_ledger_link = None
-                
-                try:
-                    # Find the contentInfo div, then get the last p tag, then find the a tag inside it
-                    content_info_div = driver.find_element(By.CLASS_NAME, "contentInfo")
-                    p_tags = content_info_div.find_elements(By.TAG_NAME, "p")
-                    
-                    if p_tags:
-                        last_p_tag = p_tags[-1]  # Get the last p tag
-                        review_ledger_link = last_p_tag.find_element(By.TAG_NAME, "a")
-                        print("Found 'Review the account ledger' link in last <p> tag of contentInfo div")
-                    else:
-                        print("No <p> tags found in contentInfo div")
-                        
-                except Exception as specific_error:
-                    print(f"Could not find link in contentInfo div: {specific_error}")
-                    
-                    # Fallback to original selectors if the specific location fails
-                    review_selectors = [
-                        (By.XPATH, "//div[@class='contentInfo']//p[last()]//a"),
-                        (By.XPATH, "//a[contains(text(), 'Review the account ledger')]"),
-                        (By.XPATH, "//a[contains(text(), 'Review')]"),
-                        (By.XPATH, "//a[contains(text(), 'ledger')]"),
-                        (By.XPATH, "//a[contains(text(), 'account ledger')]")
-                    ]
-                    
-                    for selector_type, selector_value in review_selectors:
-                        try:
-                            review_ledger_link = driver.find_element(selector_type, selector_value)
-                            print(f"Found 'Review the account ledger' link using fallback: {selector_type}='{selector_value}'")
-                            break
-                        except:
-                            continue
-                
-                if review_ledger_link:
-                    review_ledger_link.click()
-                    print("Clicked 'Review the account ledger' link")
-                    time.sleep(buffer)  # Wait for the ledger page to load
-                # Wait a moment for the page to update after saving
-                time.sleep(buffer)
-                
-                # Look for the "Review the account ledger" link
-                review_ledger_link = None
-                review_selectors = [
-                    (By.XPATH, "//a[contains(text(), 'Review the account ledger')]"),
-                    (By.XPATH, "//a[contains(text(), 'Review')]"),
-                    (By.XPATH, "//a[contains(text(), 'ledger')]"),
-                    (By.XPATH, "//a[contains(text(), 'account ledger')]")
-                ]
-                
-                for selector_type, selector_value in review_selectors:
-                    try:
-                        review_ledger_link = driver.find_element(selector_type, selector_value)
-                        print(f"Found 'Review the account ledger' link using: {selector_type}='{selector_value}'")
-                        break
-                    except:
-                        continue
-                
-                if review_ledger_link:
-                    review_ledger_link.click()
-                    print("Clicked 'Review the account ledger' link")
-                    time.sleep(buffer)  # Wait for the ledger page to load
-                    
-                    # Now check the current balance on this page
-                    try:
-                        # Try multiple selectors for the current balance
-                        current_balance = None
-                        balance_selectors = [
-                            (By.ID, "current-balance"),
-                            (By.CSS_SELECTOR, "#current-balance"),
-                            (By.XPATH, "//*[@id='current-balance']"),
-                            (By.XPATH, "//span[@id='current-balance']"),
-                            (By.XPATH, "//div[@id='current-balance']"),
-                            (By.XPATH, "//*[contains(@id, 'balance')]"),
-                            (By.XPATH, "//*[contains(text(), '$')]")
-                        ]
-                        
-                        for selector_type, selector_value in balance_selectors:
-                            try:
-                                current_balance_element = WebDriverWait(driver, 3).until(
-                                    EC.presence_of_element_located((selector_type, selector_value))
-                                )
-                                current_balance = current_balance_element.text.strip()
-                                print(f"Found balance using {selector_type}='{selector_value}': {current_balance}")
-                                if current_balance:  # If we got some text, break
-                                    break
-                            except Exception as selector_error:
-                                print(f"Selector {selector_type}='{selector_value}' failed: {selector_error}")
-                                continue
-                        
-                        if current_balance:
-                            print(f"Current balance: {current_balance}")
-                            
-                            # Check if balance is zero (could be $0.00, 0.00, or similar)
-                            if "0.00" in current_balance or current_balance == "0" or current_balance == "$0":
-                                print("✅ Balance is correctly zeroed out - payment successful")
-                                
-                                # Mark email as processed since payment was successful
-                                mark_email_processed(email_id, reference_number)
-                                
-                            else:
-                                print(f"⚠️ Balance is NOT zero: {current_balance} - this was a partial payment")
-                                print("✅ Payment was successfully applied - marking email as processed")
-                                
-                                # Mark email as processed since the payment was successfully applied
-                                # Even though balance isn't zero, the e-transfer was processed
-                                mark_email_processed(email_id, reference_number)
-                        else:
-                            print("Could not read balance from any selector - moving to next e-transfer")
-                            continue  # Skip to next email
-                            
-                    except Exception as balance_error:
-                        print(f"Error during balance check: {balance_error}")
-                        print("Moving to next e-transfer")
-                        continue  # Skip to next email
-                        
-                else:
-                    print("Could not find 'Review the account ledger' link - moving to next e-transfer")
-                    continue  # Skip to next email
-                    
-            except Exception as ledger_link_error:
-                print(f"Error finding 'Review the account ledger' link: {ledger_link_error}")
-                print("Moving to next e-transfer")
-                continue  # Skip to next email
+def save_payment():
+    """Click the save button; True only when the payment was actually submitted"""
+    trace_step("savepayment")
+    print("Looking for save/submit button...")
+    save_button = selectors.find(driver, "payment_form", "save_button")
+    if not save_button:
+        print("Could not find save button - payment form filled but not submitted")
+        return False
+    
+    try:
+        save_button.click()
+        print("Successfully clicked save button")
+        time.sleep(buffer)  # Wait for save to complete
+        return True
+    except Exception as e:
+        print(f"Error clicking save button: {e}")
+        return False
 
-            print(f"Payment processing completed for e-transfer from {sender_name}")
-                
+def verify_payment(ledger_state, from_response=True):
+    """Compare the post-save ledger balance with the expected amount; returns the balance, or None when it could not be read"""
+    trace_step("verify")
+    expected_balance = ledger_state.get("expected_balance")
+    current_balance = fetch_balance_after_save(ledger_state.get("ledger_url"), from_response)
+    
+    if current_balance is None:
+        print("Could not read balance after saving - moving to next e-transfer")
+        return None
+    
+    print(f"Current balance: ${current_balance:.2f}")
+    if expected_balance is None:
+        print("⚠️ No pre-payment balance to compare against - accepting saved payment")
+    elif abs(current_balance - expected_balance) < 0.01:
+        print(f"✅ Balance matches expected post-payment amount ${expected_balance:.2f}")
+    else:
+        print(f"❌ Balance ${current_balance:.2f} differs from expected ${expected_balance:.2f} - check this ledger")
+        metrics.increment("balance_mismatch")
+    return current_balance
+
+def supervise_browser():
+    """Between payments: restart the browser (restoring the session) when it is due for recycling or was killed"""
+    if driver is None:
+        return
+    reason = browser_supervisor.restart_reason(driver)
+    if not reason:
+        return
+    
+    print(f"♻️ Restarting browser ({reason})")
+    metrics.increment("browser_restarts")
+    if not browser_supervisor.killed:
+        trace_step("restart")
+        try:
+            session_store.save_cookies(driver.get_cookies())
         except Exception as e:
-            print(f"Error processing e-transfer email: {e}")
+            print(f"Could not save session cookies before restart: {e}")
+    browser_supervisor.stop(driver)
+    login_to_studio_director()
+
+def skip_duplicate(message_key, email_id, reference_number, ledger_url):
+    """Record a reference that is already posted and label its email without posting again"""
+    print(f"⚠️ Reference {reference_number} is already posted on {ledger_url} - not posting a duplicate")
+    metrics.increment("duplicate_blocked")
+    journal.record(message_key, "verified", {"duplicate_of": ledger_url})
+    if mark_email_processed(email_id, reference_number):
+        journal.record(message_key, "labeled")
+
+def collect_search_results():
+    """Return (name, href) for every result on the current search page and add the names to the family index"""
+    results = driver.execute_script("""
+        var links = document.querySelectorAll("div.searchResultItem a, table#accountsTable tr:not(:first-child) a");
+        return Array.prototype.map.call(links, function(link) { return [link.textContent.trim(), link.href]; });
+    """) or []
+    seen = set()
+    unique_results = []
+    for name, href in results:
+        if href and href not in seen:
+            seen.add(href)
+            unique_results.append((name, href))
+            family_index.add(href, name)
+    return unique_results
+
+def collect_result_links():
+    """Return the hrefs of every family in the current search results"""
+    return [href for name, href in collect_search_results()]
+
+def match_sender_to_family(transfer):
+    """Pick the family for the bank's sender name from the name index, refreshed by a surname search; None when not confident"""
+    sender_name = transfer.sender_name
+    
+    # The index only knows families seen in earlier searches, so every family with this surname is loaded before ranking
+    tokens = sorted((token for token in normalize_tokens(sender_name) if len(token) > 1), key=len, reverse=True)
+    if not tokens or not search_studio_director(tokens[0]):
+        transfer.review_reason = f"could not search Studio Director for sender '{sender_name}'"
+        print(f"⚠️ Routing to review: {transfer.review_reason}")
+        metrics.increment("sender_match_review")
+        return None
+    collect_search_results()
+    matches = family_index.match(sender_name)
+    
+    print(f"Sender name candidates for '{sender_name}': {matches}")
+    if is_confident_match(matches) and names_agree(sender_name, matches[0][2]):
+        score, family_href, matched_name = matches[0]
+        print(f"✅ Matched sender '{sender_name}' to '{matched_name}' (score {score})")
+        metrics.increment("sender_match_confident")
+        return family_href
+    
+    transfer.review_reason = f"low-confidence sender match: '{sender_name}' {matches[:3]}"
+    print(f"⚠️ Routing to review: {transfer.review_reason}")
+    metrics.increment("sender_match_review")
+    return None
+
+def is_confident_match(matches):
+    """Best candidate is above the threshold and clearly ahead of the runner-up"""
+    if not matches or matches[0][0] < family_match_threshold:
+        return False
+    return len(matches) == 1 or matches[0][0] - matches[1][0] >= family_match_margin
+
+def build_reference_index(query=family_listing_query, with_charges=False):
+    """Backfill pass: read every family ledger once and index the references already posted (and mirror unpaid charges)"""
+    if not search_studio_director(query):
+        print("❌ Could not run the family listing search")
+        return
+    
+    family_links = collect_result_links()
+    print(f"Indexing references for {len(family_links)} families...")
+    
+    for i, href in enumerate(family_links):
+        try:
+            driver.get(href)
+            time.sleep(buffer)
+            ledger_state = open_ledger_tab()
+            # Families whose balance has not moved keep their mirrored charges without opening the payment form
+            if with_charges:
+                if charge_mirror.get(ledger_state["ledger_url"], ledger_state["balance_before"]) is not None:
+                    metrics.increment("unpaid_charges.mirror_kept")
+                elif open_payment_form():
+                    read_unpaid_charges(ledger_state)
+            print(f"Indexed family {i+1}/{len(family_links)}")
+        except Exception as e:
+            print(f"Could not index family {href}: {e}")
+    
+    print(f"✅ Reference index now holds the ledger notes of {reference_index.count()} families")
+    if with_charges:
+        print(f"✅ Unpaid charges mirrored for {charge_mirror.count()} families")
+
+@sampling_profiler.phase("post")
+def process_etransfer(transfer, processed_references):
+    """Run one e-transfer through the journaled steps; returns (failure reason, needs review) or None"""
+    message_key = transfer.message_key
+    email_id = transfer.uid
+    entry = journal.get(message_key)
+    state = entry["state"] if entry else None
+    
+    if state == "labeled":
+        print(f"Journal: {message_key} already completed, skipping")
+        metrics.increment("journal_skipped_completed")
+        return
+    
+    if PaymentJournal.reached(state, "parsed"):
+        print(f"Journal: resuming {transfer.reference_number} from state '{state}'")
+        metrics.increment("journal_resumed")
+    else:
+        journal.record(message_key, "fetched")
+        if not transfer.is_complete():
+            print(f"No reference number or amount found in email {message_key}")
+            return (transfer.review_reason or "could not parse reference number or amount", True)
+        journal.record(message_key, "parsed", transfer.to_dict(), transfer.reference_number)
+    
+    reference_number = transfer.reference_number
+    
+    # Check if we've already processed this reference number
+    if reference_number in processed_references:
+        print(f"⚠️ Reference number {reference_number} already processed, skipping duplicate")
+        return
+    processed_references.add(reference_number)
+    print(f"✅ Added {reference_number} to processed references")
+    
+    print(f"Processing e-transfer: ${transfer.amount} from {transfer.sender_name} <{transfer.replyto_address}>")
+    if transfer.etransfer_message:
+        print(f"E-transfer message: '{transfer.etransfer_message}'")
+    
+    # The reference index (built during earlier runs or by index-references) knows posted payments
+    posted_to = reference_index.lookup(reference_number)
+    if not posted_to and PaymentJournal.reached(journal.find_reference(reference_number), "saved"):
+        # The same transfer was already posted from another source (its email or a bank statement row)
+        posted_to = "an earlier journal entry"
+    if posted_to and not PaymentJournal.reached(state, "saved"):
+        skip_duplicate(message_key, email_id, reference_number, posted_to)
+        return
+    
+    if not PaymentJournal.reached(state, "saved"):
+        # Go straight to a ledger found by an earlier run instead of searching again
+        ledger_url = entry["data"].get("ledger_url") if entry else None
+        if PaymentJournal.reached(state, "family_resolved") and ledger_url and reopen_ledger(ledger_url):
+            print(f"Journal: reopened ledger {ledger_url}")
+            metrics.increment("journal_search_avoided")
+            ledger_state = read_ledger_state()
+        else:
+            with metrics.timer("step.search"):
+                found = find_family_account(transfer)
+            if not found:
+                if transfer.review_reason:
+                    review_reason = transfer.review_reason
+                    journal.record(message_key, "parsed", {"review_reason": review_reason})
+                    return (review_reason, True)
+                return ("no matching family found", False)
+            with metrics.timer("step.ledger"):
+                ledger_state = open_family_ledger()
+            if ledger_state is None:
+                print("Could not open the family ledger, skipping this email")
+                return ("could not open family ledger", False)
+        journal.record(message_key, "family_resolved", ledger_state)
+        
+        # Refuse to post a reference that is already in this family's ledger notes
+        if reference_index.family_has(ledger_state["ledger_url"], reference_number):
+            skip_duplicate(message_key, email_id, reference_number, ledger_state["ledger_url"])
+            return
+        
+        # Past this point the payment is posted; stop here rather than start a form the budget cannot finish
+        deadline.check("payment form")
+        with metrics.timer("step.payment_form"):
+            form = fill_payment_form(transfer, ledger_state)
+        if form is None:
+            return ("could not open payment form", False)
+        if form is False:
+            return ("could not fill split rows", False)
+        unpaid_charges, allocations = form
+        expected_balance = expected_balance_after_payment(transfer.amount, ledger_state["balance_before"], unpaid_charges)
+        journal.record(message_key, "form_filled", {"expected_balance": expected_balance})
+        
+        if safe_mode:
+            print("SAFE MODE: Skipping save button click and balance verification")
+            return
+        
+        with metrics.timer("step.save"):
+            saved = save_payment()
+        if not saved:
+            return ("could not save payment", False)
+        journal.record(message_key, "saved")
+        metrics.increment("payments_posted")
+        reference_index.add_reference(ledger_state["ledger_url"], reference_number)
+        charge_mirror.apply_payment(ledger_state["ledger_url"], unpaid_charges, allocations, expected_balance)
+        print("Payment processing completed for this e-transfer")
+        from_response = True
+    else:
+        print(f"Journal: payment {reference_number} was already saved - not posting it again")
+        metrics.increment("journal_repost_avoided")
+        from_response = False
+    
+    # Verify the payment from the save response, or fetch the ledger balance in one request
+    if not PaymentJournal.reached(state, "verified"):
+        saved_state = journal.get(message_key)["data"]
+        with metrics.timer("step.verify"):
+            balance_after = verify_payment(saved_state, from_response)
+        if balance_after is None:
+            return ("could not read balance after saving", False)
+        expected_balance = saved_state.get("expected_balance")
+        if expected_balance is not None and abs(balance_after - expected_balance) >= 0.01:
+            # The payment is saved, so it must not be retried; a person checks the ledger and the email stays unlabeled
+            journal.record(message_key, "saved", {"balance_after": balance_after})
+            return (f"balance mismatch: ${balance_after:.2f} after saving, expected ${expected_balance:.2f}", True)
+        journal.record(message_key, "verified")
+    
+    # The e-transfer was applied - mark the email as processed
+    if mark_email_processed(email_id, reference_number):
+        journal.record(message_key, "labeled")
+
+    print(f"Payment processing completed for e-transfer from {transfer.sender_name}")
+    return None
+
+def order_transfers(transfers, order=run_order):
+    """Collect the pending e-transfers in the order a time-limited run should post them ('oldest' or 'largest' first)"""
+    transfers = list(transfers)
+    if order == "largest":
+        transfers.sort(key=lambda transfer: transfer.amount or 0, reverse=True)
+    else:
+        transfers.sort(key=lambda transfer: transfer.date or datetime.date.max)
+    return transfers
+
+def process_emails(transfers=None, max_runtime=None, order=run_order):
+    """Process e-transfers (by default the unread ones from fetch_emails()); returns how many were seen"""
+    if transfers is None:
+        transfers = fetch_emails()
+    transfers = sampling_profiler.iter_in_phase(transfers, "fetch")
+    
+    # A time-limited run only starts a payment it can expect to finish, so it never stops mid-form
+    stop_at = None
+    if max_runtime:
+        transfers = order_transfers(transfers, order)
+        stop_at = time.monotonic() + max_runtime
+        payment_cost = journal.estimate_cost(default=email_time_budget)
+        print(f"Time-limited run: {len(transfers)} e-transfers ({order} first), {max_runtime / 60:.1f} min budget, ~{payment_cost:.0f}s per payment")
+    
+    # Keep track of processed reference numbers to avoid duplicates
+    processed_references = set()
+    transfer_count = 0
+    
+    # Each e-transfer is processed as soon as it is fetched; only its compact record is kept
+    for transfer in transfers:
+        transfer_count += 1
+        metrics.increment("etransfers_found")
+        message_key = transfer.message_key
+        
+        # Don't repeat the expensive search sequence for emails that are backing off or need review
+        if not retry_queue.is_due(message_key):
+            entry = retry_queue.get(message_key)
+            print(f"Skipping {message_key}: {entry['status']} after {entry['attempts']} attempt(s) ({entry['reason']})")
+            metrics.increment(f"retry_skipped.{entry['status']}")
             continue
+        
+        time_budget = email_time_budget
+        if stop_at is not None:
+            time_left = stop_at - time.monotonic()
+            if time_left < payment_cost:
+                deferred = len(transfers) - transfer_count + 1
+                print(f"⏸️ {time_left:.0f}s left, ~{payment_cost:.0f}s needed per payment - leaving {deferred} e-transfer(s) for the next run")
+                metrics.increment("deferred_for_runtime", deferred)
+                break
+            time_budget = min(email_time_budget, time_left)
+        
+        journal_entry = journal.get(message_key)
+        already_saved = PaymentJournal.reached(journal_entry["state"] if journal_entry else None, "saved")
+        started = time.monotonic()
+        
+        supervise_browser()
+        try:
+            with browser_supervisor.operation("process_etransfer"), deadline.budget("email", time_budget):
+                failure = process_etransfer(transfer, processed_references)
+        except deadline.DeadlineExceeded as e:
+            # Hand the e-transfer to the retry queue; the journal lets the next attempt resume where this one stopped
+            print(f"⏱️ Giving up on this e-transfer for now: {e}")
+            failure = (f"deadline exceeded: {e}", False)
+        except Exception as e:
+            print(f"Error processing e-transfer email: {e}")
+            failure = (f"error: {e}", False)
+        
+        if failure:
+            reason, needs_review = failure
+            journal_entry = journal.get(message_key)
+            status = retry_queue.record_failure(message_key, reason, journal_entry["reference_number"] if journal_entry else None, needs_review)
+            print(f"⚠️ E-transfer failed ({reason}) - queued for {status}")
+            metrics.increment(f"failed.{reason.split(':')[0]}")
+        else:
+            retry_queue.clear(message_key)
+        browser_supervisor.payment_done()
+        
+        # Feed the per-payment cost estimate used by time-limited runs
+        elapsed = time.monotonic() - started
+        metrics.observe("step.etransfer", elapsed)
+        if not already_saved:
+            # Only an attempt that posted the payment counts as completed; duplicate skips and safe-mode exits take near-zero time
+            journal_entry = journal.get(message_key)
+            journal.record_cost(message_key, elapsed, PaymentJournal.reached(journal_entry["state"] if journal_entry else None, "saved"))
+    
+    if transfer_count == 0:
+        print("No e-transfer emails found to process")
+    else:
+        print(f"Processed {transfer_count} e-transfer emails")
+    return transfer_count
 
+def remember_message_keys(transfers, message_keys):
+    """Pass transfers through, appending each one's journal key to message_keys"""
+    for transfer in transfers:
+        message_keys.append(transfer.message_key)
+        yield transfer
 
-if __name__ == "__main__":
+def run_backfill(since, until, chunk_days=backfill_chunk_days):
+    """Process Seen and unseen e-transfers from since to until (inclusive) in date chunks, resuming from the last checkpoint"""
+    checkpoint = journal.get_backfill_checkpoint(since, until)
+    chunk_start = checkpoint + datetime.timedelta(days=1) if checkpoint else since
+    if checkpoint:
+        print(f"Resuming backfill {since} - {until} after checkpoint {checkpoint}")
+    
+    total_transfers = 0
+    backfill_start = time.monotonic()
+    checkpoint_held = False  # Set once a chunk leaves retryable failures; later chunks still run but are not checkpointed
+    
+    while chunk_start <= until:
+        chunk_end = min(chunk_start + datetime.timedelta(days=chunk_days - 1), until)
+        print(f"\n=== Backfill chunk {chunk_start} - {chunk_end} ===")
+        
+        chunk_timer = time.monotonic()
+        chunk_keys = []
+        # Already-posted payments are caught by the journal and the reference index inside process_etransfer()
+        chunk_transfers = process_emails(remember_message_keys(fetch_emails(chunk_start, chunk_end + datetime.timedelta(days=1), unseen_only=False), chunk_keys))
+        elapsed = time.monotonic() - chunk_timer
+        
+        # Normal runs only look at recent unread mail, so a failure left behind the checkpoint would never be retried
+        pending = retry_queue.pending_retries(chunk_keys)
+        if pending and not checkpoint_held:
+            print(f"⚠️ {len(pending)} e-transfer(s) in this chunk are waiting for a retry - the checkpoint stays before {chunk_start} so the next backfill retries them")
+            checkpoint_held = True
+        if not checkpoint_held:
+            journal.save_backfill_checkpoint(since, until, chunk_end)
+        total_transfers += chunk_transfers
+        rate = chunk_transfers / elapsed * 60 if elapsed else 0
+        print(f"✅ Chunk {chunk_start} - {chunk_end} done: {chunk_transfers} e-transfers in {elapsed:.0f}s ({rate:.1f}/min)")
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+    
+    total_elapsed = time.monotonic() - backfill_start
+    rate = total_transfers / total_elapsed * 60 if total_elapsed else 0
+    print(f"=== Backfill complete: {total_transfers} e-transfers in {total_elapsed:.0f}s ({rate:.1f}/min) ===")
+
+def run_bank_import(paths):
+    """Reconcile bank statement exports in one batch through the same family search and posting steps"""
+    global mail_source
+    mail_source = BankStatementSource(paths)
+    login_to_studio_director()
+    print("\n=== Processing Bank Statement Rows ===")
+    process_emails(mail_source.fetch_transfers())
+
+def print_review_list():
+    """Show the permanent failures gathered by the retry queue"""
+    review = retry_queue.review_list()
+    print(f"{len(review)} e-transfer(s) need review")
+    for entry in review:
+        print(f"  {entry['updated_at']}  ref={entry['reference_number']}  attempts={entry['attempts']}  {entry['reason']}")
+
+def run_bot(max_runtime=None, order=run_order):
+    """Log in and process the pending e-transfer emails"""
+    # Step 1: Login to Studio Director
+    login_to_studio_director()
+    
+    # Step 2: Process emails
+    print("\n=== Processing Emails ===")
+    process_emails(max_runtime=max_runtime, order=order)
+
+def ensure_logged_in():
+    """Keep using the open browser while its session is valid; otherwise (re)start it and log in"""
+    if driver is not None:
+        if studio_director_session_active():
+            return True
+        print("Browser session is no longer valid, restarting the browser")
+        browser_supervisor.stop(driver)
+    return login_to_studio_director()
+
+def in_quiet_hours(now, quiet_hours=schedule_quiet_hours):
+    """True when now falls in the (start hour, end hour) window, which may wrap past midnight"""
+    if not quiet_hours:
+        return False
+    start, end = quiet_hours
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+def run_schedule(interval_minutes=schedule_interval_minutes, jitter_seconds=schedule_jitter_seconds):
+    """Process new e-transfers every interval (plus jitter) outside quiet hours, keeping the browser and mailbox warm between ticks; the caller holds the run lock throughout"""
+    global network_trace
+    while True:
+        if in_quiet_hours(datetime.datetime.now()):
+            print("Quiet hours - skipping this run")
+        else:
+            metrics.reset()
+            run_started = datetime.datetime.now()
+            run_error = None
+            print(f"\n=== Scheduled run at {run_started:%Y-%m-%d %H:%M} ===")
+            try:
+                ensure_logged_in()
+                # Stop between payments in time for the next tick; the rest is picked up then
+                process_emails(max_runtime=interval_minutes * 60, order=run_order)
+            except Exception as e:
+                print(f"Scheduled run failed: {e}")
+                run_error = str(e)
+            metrics.print_summary()
+            run_history.record("schedule", run_started, metrics.counters, metrics.timings, run_error)
+            if network_trace:
+                # One trace file per scheduled run; the open browser keeps its CDP logging
+                network_trace.write(driver)
+                network_trace = NetworkTrace(trace_dir)
+        
+        delay = interval_minutes * 60 + random.uniform(0, jitter_seconds)
+        print(f"Next run in {delay / 60:.1f} minutes")
+        time.sleep(delay)
+
+def main():
+    global network_trace
+    parser = argparse.ArgumentParser(description="Post Interac e-transfer payments to Studio Director")
+    parser.add_argument("--trace", action="store_true", help="Record Chrome network and performance events per step to a trace file")
+    parser.add_argument("--profile", action="store_true", help="Sample the run's Python stacks and write a speedscope profile (CPU vs blocked time)")
+    parser.add_argument("--profile-phase", choices=("login", "fetch", "parse", "post"), help="With --profile, only sample this phase")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="Process pending e-transfer emails (default)")
+    run_parser.add_argument("--max-runtime", type=float, help="Minutes this run may take; stops between payments and leaves the rest for the next run")
+    run_parser.add_argument("--order", choices=("oldest", "largest"), default=run_order, help="Which e-transfers a time-limited run posts first")
+    index_parser = subparsers.add_parser("index-references", help="Index the references already posted on every family ledger")
+    index_parser.add_argument("--query", default=family_listing_query, help="Search that lists the families to index")
+    index_parser.add_argument("--charges", action="store_true", help="Also mirror each family's unpaid charges (only families whose balance changed are re-read)")
+    subparsers.add_parser("review", help="List e-transfers that failed permanently and need a person to post them")
+    trends_parser = subparsers.add_parser("trends", help="Show payments per minute, the slowest steps and failure reasons over recent runs")
+    trends_parser.add_argument("--runs", default=30, type=int, help="How many recent runs to include")
+    backfill_parser = subparsers.add_parser("backfill", help="Catch up on e-transfers (including already-read ones) over a date range")
+    backfill_parser.add_argument("--since", required=True, type=datetime.date.fromisoformat, help="First day to include (YYYY-MM-DD)")
+    backfill_parser.add_argument("--until", default=datetime.date.today(), type=datetime.date.fromisoformat, help="Last day to include (YYYY-MM-DD, default today)")
+    backfill_parser.add_argument("--chunk-days", default=backfill_chunk_days, type=int, help="Days per checkpointed chunk")
+    schedule_parser = subparsers.add_parser("schedule", help="Keep running and process new e-transfers on an interval")
+    schedule_parser.add_argument("--interval", default=schedule_interval_minutes, type=float, help="Minutes between runs")
+    schedule_parser.add_argument("--jitter", default=schedule_jitter_seconds, type=float, help="Random extra seconds added to each interval")
+    bank_parser = subparsers.add_parser("import-bank", help="Post the incoming e-transfers found in bank CSV/OFX exports")
+    bank_parser.add_argument("files", nargs="+", help="Bank statement exports (.csv, .ofx or .qfx)")
+    for command_parser in (run_parser, backfill_parser, schedule_parser):
+        command_parser.add_argument("--source", default="imap", help="'imap' (default), or an mbox file, Maildir or directory of .eml files")
+    args = parser.parse_args()
+    
+    if args.command == "review":
+        print_review_list()
+        return
+    if args.command == "trends":
+        run_history.print_trends(args.runs)
+        return
+    
+    if args.trace:
+        network_trace = NetworkTrace(trace_dir)
+    
+    profiler = None
+    if args.profile or args.profile_phase:
+        profiler = SamplingProfiler(profile_dir, profile_interval_ms, args.profile_phase)
+        profiler.start()
+    
+    run_started = datetime.datetime.now()
+    run_error = None
+    lock_skipped = False
     try:
         print("=== Dance Ink Bot Starting ===")
         
-        # Step 1: Login to Studio Director
-        login_to_studio_director()
-        
-        # Step 2: Process emails
-        print("\n=== Processing Emails ===")
-        process_emails()
+        with single_instance(lock_path) as acquired:
+            if not acquired:
+                print(f"Another run holds {lock_path} - exiting")
+                lock_skipped = True
+                return
+            
+            if args.command == "schedule":
+                # The scheduler keeps Chrome open on the shared profile between ticks, so it holds the lock for its whole life
+                open_default_mail_source(args.source)
+                run_schedule(args.interval, args.jitter)
+            elif args.command == "index-references":
+                login_to_studio_director()
+                build_reference_index(args.query, args.charges)
+            elif args.command == "import-bank":
+                run_bank_import(args.files)
+            elif args.command == "backfill":
+                open_default_mail_source(args.source)
+                login_to_studio_director()
+                run_backfill(args.since, args.until, args.chunk_days)
+            else:
+                open_default_mail_source(getattr(args, "source", "imap"))
+                max_runtime = getattr(args, "max_runtime", None)
+                run_bot(max_runtime * 60 if max_runtime else None, getattr(args, "order", run_order))
         
+        metrics.print_summary()
         print("=== Dance Ink Bot Finished Successfully ===")
         
     except Exception as e:
         print(f"Fatal error in main execution: {e}")
         print("=== Dance Ink Bot Finished with Errors ===")
+        run_error = str(e)
     finally:
+        # Scheduled runs record one row per tick instead; a run that found the lock taken did no work worth a row
+        if args.command != "schedule" and not lock_skipped:
+            run_history.record(args.command or "run", run_started, metrics.counters, metrics.timings, run_error)
+        
+        if profiler:
+            profiler.stop()
+        
+        if network_trace:
+            try:
+                network_trace.write(driver if browser_supervisor.root_pid else None)
+            except Exception as e:
+                print(f"Could not write network trace: {e}")
+        
         # Close the browser
         try:
             driver.quit()
@@ -1759,3 +1952,7 @@ if __name__ == "__main__":
         
         # Close email connection
         cleanup_email_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import time
+from contextlib import contextmanager
+import metrics
+
+class DeadlineExceeded(Exception):
+    """The e-transfer being processed has used up its time budget"""
+
+# (name, monotonic deadline, budget seconds) of the budget currently in force, or None
+active = None
+
+@contextmanager
+def budget(name, seconds):
+    """Cap the total time of the wrapped block; fallbacks call check() and give up once it is spent"""
+    global active
+    started = time.monotonic()
+    active = (name, started + seconds, seconds)
+    try:
+        yield
+    finally:
+        used = time.monotonic() - started
+        active = None
+        metrics.observe(f"{name}_budget_used", used)
+        metrics.sample(f"{name}_budget_used_pct", used / seconds * 100)
+
+def remaining():
+    """Seconds left in the active budget, or None outside a budget"""
+    if active is None:
+        return None
+    return active[1] - time.monotonic()
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+def check(step):
+    """Raise DeadlineExceeded instead of starting step once the budget is spent"""
+    if expired():
+        name, deadline, seconds = active
+        metrics.increment(f"{name}_budget_exceeded")
+        raise DeadlineExceeded(f"{seconds}s budget spent before {step}")
+
+def cap(timeout):
+    """Shorten a wait so it cannot run past the budget"""
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(0.1, min(timeout, left))
@@ -4,30 +4,45 @@ import imaplib
 import datetime
 import email
 import re
-from config import email_username, email_password
+import sys
+from config import email_username, email_password, imap_host
+from mail_sources import open_mail_source
 
-def debug_emails():
-    try:
-        # Connect to the email server
-        mail = imaplib.IMAP4_SSL('imap.gmail.com')
-        mail.login(email_username, email_password)
-        mail.select('inbox')
+def iter_todays_emails():
+    """Yield today's raw emails from the live inbox"""
+    # Connect to the email server
+    mail = imaplib.IMAP4_SSL(imap_host)
+    mail.login(email_username, email_password)
+    mail.select('inbox')
 
+    try:
         # Search for today's emails
         today = datetime.date.today().strftime("%d-%b-%Y")
         result, data = mail.search(None, f'(SENTSINCE {today})')
         
         if data[0] is None:
             print("No emails found for today.")
-            mail.logout()
             return
             
         email_ids = data[0].split()
         print(f"Found {len(email_ids)} emails from today.")
 
-        for i, email_id in enumerate(email_ids):
+        for email_id in email_ids:
             result, msg_data = mail.fetch(email_id, '(RFC822)')
-            msg = email.message_from_bytes(msg_data[0][1])
+            yield msg_data[0][1]
+    finally:
+        mail.logout()
+
+def debug_emails(source_path=None):
+    """Dump today's inbox, or every email in an mbox/Maildir/.eml source when a path is given"""
+    try:
+        if source_path:
+            raw_emails = (raw for uid, raw in open_mail_source(source_path).iter_raw(None, None, False))
+        else:
+            raw_emails = iter_todays_emails()
+
+        for i, raw in enumerate(raw_emails):
+            msg = email.message_from_bytes(raw)
             
             print(f"\n=== EMAIL {i+1} ===")
             print(f"Subject: {msg['Subject']}")
@@ -84,11 +99,9 @@ def debug_emails():
                     print(f"All numbers found: {numbers}")
             
             print("-" * 50)
-
-        mail.logout()
         
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    debug_emails()
+    debug_emails(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import re
+import sqlite3
+import unicodedata
+
+# Words that carry no identity in bank-formatted sender names
+STOP_WORDS = {"mr", "mrs", "ms", "miss", "dr", "and", "the", "family", "de", "la"}
+
+def normalize_tokens(name):
+    """Lowercase, strip accents and punctuation, and split a name into tokens ('SMITH, J.' -> ['smith', 'j'])"""
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    tokens = re.split(r"[^a-z0-9]+", name.lower())
+    return [token for token in tokens if token and token not in STOP_WORDS]
+
+def soundex(token):
+    """Classic Soundex key so 'smyth' and 'smith' land in the same bucket"""
+    codes = {c: str(d) for d, letters in enumerate(("aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r")) for c in letters}
+    if not token:
+        return ""
+    key = token[0]
+    previous = codes.get(token[0], "")
+    for char in token[1:]:
+        code = codes.get(char, "")
+        if code and code != "0" and code != previous:
+            key += code
+        if char not in "hw":
+            previous = code
+    return (key + "000")[:4]
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b):
+    """Levenshtein distance between two short tokens"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def token_similarity(query_token, candidate_token):
+    """Similarity in [0, 1] between one query token and one candidate token"""
+    if query_token == candidate_token:
+        return 1.0
+    # Bank names often shorten given names to an initial ("SMITH J")
+    if len(query_token) == 1 or len(candidate_token) == 1:
+        return 0.7 if query_token[0] == candidate_token[0] else 0.0
+    longest = max(len(query_token), len(candidate_token))
+    ratio = 1 - edit_distance(query_token, candidate_token) / longest
+    if soundex(query_token) == soundex(candidate_token):
+        ratio = max(ratio, 0.8)
+    return ratio if ratio >= 0.6 else 0.0
+
+def name_score(query_tokens, candidate_tokens):
+    """Score how well a sender name matches a family/guardian name, ignoring token order"""
+    if not query_tokens or not candidate_tokens:
+        return 0.0
+    best = [max(token_similarity(q, c) for c in candidate_tokens) for q in query_tokens]
+    # Every full-word query token (typically the surname) must match something reasonably well
+    if any(score < 0.6 for q, score in zip(query_tokens, best) if len(q) > 1):
+        return 0.0
+    return sum(best) / len(best)
+
+def names_agree(sender_name, candidate_name):
+    """Whether every full word of the sender name (given name and surname, at least two) appears exactly in the candidate name"""
+    # Fuzzy scores rank candidates; posting without a person checking needs the given name itself, not an initial or a near miss
+    query_tokens = [token for token in normalize_tokens(sender_name) if len(token) > 1]
+    candidate_tokens = set(normalize_tokens(candidate_name))
+    return len(query_tokens) >= 2 and all(token in candidate_tokens for token in query_tokens)
+
+class FamilyNameIndex:
+    """In-memory index over family and guardian names, persisted in SQLite and refreshed from search results"""
+    
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS family_names (
+                family_key TEXT PRIMARY KEY,
+                names TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.families = {}  # family_key -> list of display names
+        self.family_tokens = {}  # family_key -> list of token lists, one per name
+        self.postings = {}  # trigram or phonetic key -> set of family_keys
+        for family_key, names in self.conn.execute("SELECT family_key, names FROM family_names"):
+            self._index(family_key, json.loads(names))
+    
+    def _index(self, family_key, names):
+        self.families[family_key] = names
+        self.family_tokens[family_key] = [normalize_tokens(name) for name in names]
+        for tokens in self.family_tokens[family_key]:
+            for token in tokens:
+                for key in trigrams(token) | {f"#{soundex(token)}"}:
+                    self.postings.setdefault(key, set()).add(family_key)
+    
+    def add(self, family_key, name):
+        """Add a family or guardian name seen on a roster/search page; returns True if it was new"""
+        name = (name or "").strip()
+        if not name or name in self.families.get(family_key, []):
+            return False
+        names = self.families.get(family_key, []) + [name]
+        self._index(family_key, names)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO family_names (family_key, names, updated_at) VALUES (?, ?, ?)",
+            (family_key, json.dumps(names), datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+        return True
+    
+    def match(self, sender_name, limit=5):
+        """Rank families for a sender name; returns [(score, family_key, matched name)] best first"""
+        query_tokens = normalize_tokens(sender_name)
+        candidates = set()
+        for token in query_tokens:
+            if len(token) > 1:
+                for key in trigrams(token) | {f"#{soundex(token)}"}:
+                    candidates |= self.postings.get(key, set())
+        
+        ranked = []
+        for family_key in candidates:
+            scored = [(name_score(query_tokens, tokens), name) for tokens, name in zip(self.family_tokens[family_key], self.families[family_key])]
+            score, name = max(scored)
+            if score > 0:
+                ranked.append((round(score, 3), family_key, name))
+        ranked.sort(key=lambda match: match[0], reverse=True)
+        return ranked[:limit]
+    
+    def __len__(self):
+        return len(self.families)
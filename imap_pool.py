@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import imaplib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+UID_PATTERN = re.compile(rb'UID (\d+)')
+
+def parse_fetch_response(msg_data):
+    """Return {uid: raw bytes} from a multi-message UID FETCH response"""
+    messages = {}
+    for item in msg_data:
+        if isinstance(item, tuple):
+            uid_match = UID_PATTERN.search(item[0])
+            if uid_match:
+                messages[uid_match.group(1)] = item[1]
+    return messages
+
+class IMAPConnectionPool:
+    """Fetches a large UID set over several authenticated IMAP connections in parallel"""
+    
+    def __init__(self, connect, username, password, mailbox="inbox", max_connections=4, batch_size=50):
+        self.connect = connect  # Callable returning a fresh, unauthenticated IMAP4 client
+        self.username = username
+        self.password = password
+        self.mailbox = mailbox
+        self.max_connections = max_connections
+        self.batch_size = batch_size
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+    
+    def get_connection(self):
+        """One connection per worker thread, opened on first use"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            connection.login(self.username, self.password)
+            connection.select(self.mailbox, readonly=True)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+    
+    def fetch_batch(self, uids):
+        connection = self.get_connection()
+        try:
+            result, msg_data = connection.uid('fetch', b",".join(uids), '(BODY.PEEK[])')
+        except Exception:
+            # The connection may be broken; this thread opens a fresh one for its next batch
+            self.local.connection = None
+            raise
+        if result != 'OK':
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {result}")
+        return parse_fetch_response(msg_data)
+    
+    def fetch(self, uids, fetch_one=None):
+        """Yield (uid, raw bytes) in UID order while batches are fetched in parallel; a failed batch is fetched one email at a time with fetch_one(uid), or skipped without it"""
+        uids = sorted(uids, key=int)
+        batches = [uids[i:i + self.batch_size] for i in range(0, len(uids), self.batch_size)]
+        print(f"Fetching {len(uids)} emails in {len(batches)} batches over up to {self.max_connections} IMAP connections")
+        
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            # Keep a bounded window of batches in flight so memory stays flat on huge mailboxes
+            window = self.max_connections * 2
+            pending = [executor.submit(self.fetch_batch, batch) for batch in batches[:window]]
+            next_batch = window
+            for i, batch in enumerate(batches):
+                try:
+                    messages = pending[i].result()
+                except Exception as e:
+                    print(f"⚠️ Fetching a batch of {len(batch)} emails failed ({e}), {'fetching them one by one' if fetch_one else 'skipping them'}")
+                    messages = None
+                pending[i] = None
+                if next_batch < len(batches):
+                    pending.append(executor.submit(self.fetch_batch, batches[next_batch]))
+                    next_batch += 1
+                if messages is None:
+                    for uid in batch:
+                        raw_message = fetch_one(uid) if fetch_one else None
+                        if raw_message is not None:
+                            yield uid, raw_message
+                    continue
+                for uid in batch:
+                    if uid in messages:
+                        yield uid, messages[uid]
+                    else:
+                        print(f"⚠️ Email {uid} missing from fetch response")
+    
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.logout()
+            except Exception:
+                pass
+        self.connections = []
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+import imaplib
+import mailbox
+import os
+from imap_pool import IMAPConnectionPool
+from transfers import iter_transfer_records
+
+class MailSource:
+    """Where e-transfer notifications come from; subclasses yield (uid, raw bytes) pairs"""
+    
+    def iter_raw(self, since, before, unseen_only):
+        raise NotImplementedError
+    
+    def fetch_transfers(self, since=None, before=None, unseen_only=True):
+        """Yield a TransferRecord for each e-transfer in [since, before), one message at a time"""
+        for record in iter_transfer_records(self.iter_raw(since, before, unseen_only)):
+            # File sources cannot search by date, so filter on the parsed record
+            if since and record.date and record.date < since:
+                continue
+            if before and record.date and record.date >= before:
+                continue
+            yield record
+    
+    def mark_processed(self, uid, reference_number):
+        """Offline sources have nothing to flag; the payment journal records completion"""
+        print(f"Email {uid} processed for reference {reference_number} (offline source, no flags to set)")
+        return True
+    
+    def close(self):
+        pass
+
+class IMAPMailSource(MailSource):
+    """Live mailbox over IMAP (Gmail), labeling processed emails"""
+    
+    def __init__(self, host, username, password, max_connections=4, batch_size=50, label_name="2025 Payments EFT's"):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.max_connections = max_connections
+        self.batch_size = batch_size
+        self.label_name = label_name
+        self.mail = None
+    
+    def connect(self):
+        """Open the IMAP connection (kept open for labeling) unless it is already connected"""
+        if self.mail is not None:
+            # Connections kept warm between scheduled runs are dropped by the server after a while
+            try:
+                self.mail.noop()
+            except Exception:
+                print("IMAP connection was closed, reconnecting")
+                self.mail = None
+        if self.mail is None:
+            # Connect to the email server
+            self.mail = imaplib.IMAP4_SSL(self.host)
+            self.mail.login(self.username, self.password)
+        self.mail.select('inbox')
+        return self.mail
+    
+    def search(self, since, before, unseen_only):
+        """Return the UIDs of e-transfer emails in the date range (UIDs stay valid across sessions)"""
+        search_criteria = f'SENTSINCE {since.strftime("%d-%b-%Y")}'
+        if before:
+            search_criteria += f' SENTBEFORE {before.strftime("%d-%b-%Y")}'
+        if unseen_only:
+            search_criteria += ' UNSEEN'
+        
+        search_criteria = f'({search_criteria} SUBJECT "e-Transfer")'
+        result, data = self.mail.uid('search', None, search_criteria)
+        uids = data[0].split() if data[0] else []
+        print(f"Found {len(uids)} e-transfer emails matching {search_criteria}")
+        return uids
+    
+    def iter_raw(self, since, before, unseen_only):
+        try:
+            self.connect()
+            uids = self.search(since, before, unseen_only)
+        except Exception as e:
+            print(f"Error fetching emails: {e}")
+            return
+        
+        if len(uids) > self.batch_size and self.max_connections > 1:
+            # Large scans (backfills, first runs): spread the fetch over extra connections, leaving one for labeling
+            pool = IMAPConnectionPool(lambda: imaplib.IMAP4_SSL(self.host), self.username, self.password,
+                                      max_connections=self.max_connections - 1, batch_size=self.batch_size)
+            try:
+                yield from pool.fetch(uids, self.fetch_one)
+            finally:
+                pool.close()
+            return
+        
+        for uid in uids:
+            raw_message = self.fetch_one(uid)
+            if raw_message is not None:
+                yield uid, raw_message
+    
+    def fetch_one(self, uid):
+        """Fetch one email over the main connection; None (after logging) when it fails, so only that email is skipped"""
+        try:
+            # Use BODY.PEEK instead of RFC822 to avoid marking email as read during fetch
+            result, msg_data = self.mail.uid('fetch', uid, '(BODY.PEEK[])')
+            return msg_data[0][1]
+        except Exception as e:
+            print(f"Error fetching email {uid}: {e}")
+            return None
+    
+    def fetch_transfers(self, since=None, before=None, unseen_only=True):
+        # The IMAP search already applied the date range
+        yield from iter_transfer_records(self.iter_raw(since, before, unseen_only))
+    
+    def mark_processed(self, uid, reference_number):
+        """Mark email as read and apply the payments label"""
+        mail = self.mail
+        try:
+            # Mark email as read
+            mail.uid('store', uid, '+FLAGS', '\\Seen')
+            print(f"✅ Marked email {uid} as read")
+            
+            # First, try to create the label (in case it doesn't exist)
+            try:
+                mail.create(self.label_name)
+                print(f"Created Gmail label: {self.label_name}")
+            except:
+                # Label already exists, which is fine
+                pass
+            
+            # Apply the label to the email
+            try:
+                mail.uid('store', uid, '+X-GM-LABELS', self.label_name)
+                print(f"✅ Applied label '{self.label_name}' to email {uid}")
+            except Exception as label_error:
+                print(f"⚠️ Could not apply label: {label_error}")
+                # Try alternative Gmail labeling method
+                try:
+                    mail.uid('copy', uid, self.label_name)
+                    print(f"✅ Applied label '{self.label_name}' using copy method")
+                except Exception as copy_error:
+                    print(f"❌ Failed to apply label with any method: {copy_error}")
+            
+            print(f"Email processing completed for reference {reference_number}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error marking email as processed: {e}")
+            return False
+    
+    def close(self):
+        """Close the email connection"""
+        try:
+            if self.mail:
+                self.mail.logout()
+                print("Email connection closed")
+        except:
+            pass
+        self.mail = None
+
+class MboxMailSource(MailSource):
+    """A single mbox file, e.g. a Google Takeout export"""
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def iter_raw(self, since, before, unseen_only):
+        box = mailbox.mbox(self.path, create=False)
+        try:
+            for key in box.iterkeys():
+                msg = box.get_message(key)
+                if unseen_only and "R" in msg.get("Status", ""):
+                    continue
+                yield str(key).encode(), msg.as_bytes()
+        finally:
+            box.close()
+
+class MaildirMailSource(MailSource):
+    """A Maildir directory (cur/new/tmp)"""
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def iter_raw(self, since, before, unseen_only):
+        box = mailbox.Maildir(self.path, factory=None, create=False)
+        for key in box.iterkeys():
+            msg = box.get_message(key)
+            if unseen_only and "S" in msg.get_flags():
+                continue
+            yield key.encode(), msg.as_bytes()
+
+class EmlDirectoryMailSource(MailSource):
+    """A directory of .eml files (searched recursively)"""
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def iter_raw(self, since, before, unseen_only):
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(".eml"):
+                    file_path = os.path.join(root, filename)
+                    with open(file_path, "rb") as f:
+                        yield os.path.relpath(file_path, self.path).encode(), f.read()
+
+def open_mail_source(spec, imap_settings=None):
+    """'imap' for the live mailbox, or a path to an mbox file, Maildir or directory of .eml files"""
+    if spec == "imap":
+        return IMAPMailSource(**imap_settings)
+    if os.path.isdir(spec):
+        if all(os.path.isdir(os.path.join(spec, sub)) for sub in ("cur", "new", "tmp")):
+            return MaildirMailSource(spec)
+        return EmlDirectoryMailSource(spec)
+    if os.path.isfile(spec):
+        return MboxMailSource(spec)
+    raise ValueError(f"Mail source not found: {spec}")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import time
+from contextlib import contextmanager
+
+# Run-level counters (e.g. "selector_degraded.admin.search_field") and step timings in seconds
+counters = {}
+timings = {}
+# Values sampled over the run, e.g. browser memory: name -> [(seconds since start, value)]
+series = {}
+run_start = time.monotonic()
+
+def increment(name, amount=1):
+    """Increase a run counter"""
+    counters[name] = counters.get(name, 0) + amount
+
+def observe(name, seconds):
+    """Record one timing sample for a step"""
+    timings.setdefault(name, []).append(seconds)
+
+def sample(name, value):
+    """Record a value (e.g. browser RSS in MiB) at the current point of the run"""
+    series.setdefault(name, []).append((time.monotonic() - run_start, value))
+
+@contextmanager
+def timer(name):
+    """Time the wrapped block and record it under name"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start)
+
+def reset():
+    """Clear all counters, timings and samples (used between scheduled runs)"""
+    global run_start
+    counters.clear()
+    timings.clear()
+    series.clear()
+    run_start = time.monotonic()
+
+def print_summary():
+    """Print all counters and timing totals collected during the run"""
+    if not counters and not timings and not series:
+        return
+    print("=== Run Metrics ===")
+    for name in sorted(counters):
+        print(f"  {name}: {counters[name]}")
+    for name in sorted(timings):
+        samples = timings[name]
+        print(f"  {name}: {len(samples)} x, total {sum(samples):.2f}s, max {max(samples):.2f}s")
+    for name in sorted(series):
+        values = [value for elapsed, value in series[name]]
+        trend = " -> ".join(f"{value:.0f}@{elapsed:.0f}s" for elapsed, value in series[name][::max(1, len(values) // 8)])
+        print(f"  {name}: {len(values)} samples, min {min(values):.1f}, max {max(values):.1f}, last {values[-1]:.1f} ({trend})")
+    print("===================")
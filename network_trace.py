@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+class NetworkTrace:
+    """Chrome DevTools Network and Performance events for one run, grouped by the bot step that caused them"""
+    
+    def __init__(self, trace_dir):
+        self.path = os.path.join(trace_dir, f"trace-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+        self.step = "startup"
+        self.step_started = time.monotonic()
+        self.pending = {}  # requestId -> request still in flight
+        self.requests = []
+        self.steps = []  # (step, wall seconds) in the order they ran
+        self.performance = []
+    
+    @staticmethod
+    def logging_prefs():
+        """Capability that makes chromedriver keep the DevTools event log readable through get_log('performance')"""
+        return {"performance": "ALL"}
+    
+    def enable(self, driver):
+        """Turn on the CDP domains on a new WebDriver session"""
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Performance.enable", {})
+            print(f"Network trace enabled, writing {self.path}")
+        except Exception as e:
+            print(f"⚠️ Could not enable network tracing: {e}")
+    
+    def set_step(self, driver, step):
+        """Attribute the events so far to the previous step and start timing the next one"""
+        self.collect(driver)
+        self.sample_performance(driver)
+        now = time.monotonic()
+        self.steps.append((self.step, now - self.step_started))
+        self.step = step
+        self.step_started = now
+    
+    def collect(self, driver):
+        """Drain the performance log; requests are finished when Chrome reports them loaded or failed"""
+        try:
+            entries = driver.get_log("performance")
+        except Exception:
+            return
+        for entry in entries:
+            message = json.loads(entry["message"])["message"]
+            method = message.get("method", "")
+            params = message.get("params", {})
+            request_id = params.get("requestId")
+            
+            if method == "Network.requestWillBeSent":
+                if request_id in self.pending and "redirectResponse" in params:
+                    self.finish(request_id, params["timestamp"], status=params["redirectResponse"].get("status"))
+                request = params["request"]
+                self.pending[request_id] = {
+                    "step": self.step,
+                    "url": request["url"],
+                    "method": request["method"],
+                    "type": params.get("type"),
+                    "start": params["timestamp"],
+                }
+            elif method == "Network.responseReceived" and request_id in self.pending:
+                response = params["response"]
+                timing = response.get("timing") or {}
+                self.pending[request_id]["status"] = response.get("status")
+                self.pending[request_id]["from_cache"] = response.get("fromDiskCache", False)
+                if timing:
+                    # Time from request sent to first response byte: the server's share of the request
+                    self.pending[request_id]["wait_ms"] = round(timing["receiveHeadersEnd"] - timing["sendEnd"], 1)
+            elif method == "Network.loadingFinished" and request_id in self.pending:
+                self.finish(request_id, params["timestamp"], size=params.get("encodedDataLength", 0))
+            elif method == "Network.loadingFailed" and request_id in self.pending:
+                self.finish(request_id, params["timestamp"], error=params.get("errorText"))
+    
+    def finish(self, request_id, timestamp, **fields):
+        request = self.pending.pop(request_id)
+        request.update(fields)
+        request["duration_ms"] = round((timestamp - request.pop("start")) * 1000, 1)
+        self.requests.append(request)
+    
+    def sample_performance(self, driver):
+        try:
+            result = driver.execute_cdp_cmd("Performance.getMetrics", {})
+        except Exception:
+            return
+        values = {metric["name"]: metric["value"] for metric in result.get("metrics", [])}
+        self.performance.append({
+            "step": self.step,
+            "js_heap_mb": round(values.get("JSHeapUsedSize", 0) / (1024 * 1024), 1),
+            "nodes": values.get("Nodes"),
+            "script_seconds": values.get("ScriptDuration"),
+            "layout_seconds": values.get("LayoutDuration"),
+        })
+    
+    @staticmethod
+    def endpoint(url):
+        """Group requests by path, so every family's ledger or search counts as the same endpoint"""
+        parts = urlsplit(url)
+        return f"{parts.netloc}{parts.path}"
+    
+    def endpoint_summary(self):
+        """(endpoint, count, total ms, max ms, mean server wait ms, bytes), slowest total first"""
+        groups = {}
+        for request in self.requests:
+            groups.setdefault(self.endpoint(request["url"]), []).append(request)
+        rows = []
+        for endpoint, requests in groups.items():
+            durations = [request["duration_ms"] for request in requests]
+            waits = [request["wait_ms"] for request in requests if "wait_ms" in request]
+            rows.append((
+                endpoint,
+                len(requests),
+                sum(durations),
+                max(durations),
+                sum(waits) / len(waits) if waits else 0,
+                sum(request.get("size", 0) for request in requests),
+            ))
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+    
+    def step_summary(self):
+        """Per step: wall time, network time and request count, so sleeps and local work show up as the difference"""
+        summary = {}
+        for step, seconds in self.steps:
+            totals = summary.setdefault(step, {"wall_ms": 0, "network_ms": 0, "requests": 0})
+            totals["wall_ms"] += seconds * 1000
+        for request in self.requests:
+            totals = summary.setdefault(request["step"], {"wall_ms": 0, "network_ms": 0, "requests": 0})
+            totals["network_ms"] += request["duration_ms"]
+            totals["requests"] += 1
+        return summary
+    
+    def write(self, driver=None):
+        """Save the trace file and print where the run's time went"""
+        if driver is not None:
+            self.set_step(driver, "shutdown")
+        else:
+            self.steps.append((self.step, time.monotonic() - self.step_started))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "requests": self.requests,
+                "steps": [{"step": step, "wall_ms": round(seconds * 1000, 1)} for step, seconds in self.steps],
+                "performance": self.performance,
+                "endpoints": self.endpoint_summary(),
+            }, f, indent=1)
+        
+        print(f"=== Network Trace ({len(self.requests)} requests, {self.path}) ===")
+        for endpoint, count, total, slowest, wait, size in self.endpoint_summary()[:10]:
+            print(f"  {endpoint}: {count} x, total {total / 1000:.2f}s, max {slowest:.0f}ms, server wait {wait:.0f}ms, {size / 1024:.0f} KiB")
+        print("  Per step (wall vs network):")
+        for step, totals in self.step_summary().items():
+            print(f"  {step}: wall {totals['wall_ms'] / 1000:.2f}s, network {totals['network_ms'] / 1000:.2f}s over {totals['requests']} requests")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import sqlite3
+
+# Steps a single e-transfer goes through, in order
+STATES = ("fetched", "parsed", "family_resolved", "form_filled", "saved", "verified", "labeled")
+
+class PaymentJournal:
+    """SQLite journal of each e-transfer email's progress so an interrupted run can resume it"""
+    
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS payment_journal (
+                message_key TEXT PRIMARY KEY,
+                reference_number TEXT,
+                state TEXT NOT NULL,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS payment_journal_reference ON payment_journal (reference_number)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_progress (
+                since TEXT NOT NULL,
+                until TEXT NOT NULL,
+                completed_through TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (since, until)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS payment_costs (
+                message_key TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                completed INTEGER NOT NULL,
+                recorded_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+    
+    def get(self, message_key):
+        """Return {'state', 'reference_number', 'data'} for an email, or None if it was never seen"""
+        row = self.conn.execute(
+            "SELECT state, reference_number, data FROM payment_journal WHERE message_key = ?", (message_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"state": row[0], "reference_number": row[1], "data": json.loads(row[2])}
+    
+    def record(self, message_key, state, data=None, reference_number=None):
+        """Persist that an email completed a step, merging any new data into what is stored"""
+        if state not in STATES:
+            raise ValueError(f"Unknown journal state: {state}")
+        entry = self.get(message_key)
+        merged = dict(entry["data"]) if entry else {}
+        merged.update(data or {})
+        reference_number = reference_number or (entry["reference_number"] if entry else None)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO payment_journal (message_key, reference_number, state, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (message_key, reference_number, state, json.dumps(merged), datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+    
+    def find_reference(self, reference_number):
+        """Return the furthest state any email with this reference number reached, or None"""
+        rows = self.conn.execute(
+            "SELECT state FROM payment_journal WHERE reference_number = ?", (reference_number,)
+        ).fetchall()
+        states = [row[0] for row in rows]
+        return max(states, key=STATES.index) if states else None
+    
+    def get_backfill_checkpoint(self, since, until):
+        """Last day a backfill over since..until fully completed, or None"""
+        row = self.conn.execute(
+            "SELECT completed_through FROM backfill_progress WHERE since = ? AND until = ?", (since.isoformat(), until.isoformat())
+        ).fetchone()
+        return datetime.date.fromisoformat(row[0]) if row else None
+    
+    def save_backfill_checkpoint(self, since, until, completed_through):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO backfill_progress (since, until, completed_through, updated_at) VALUES (?, ?, ?, ?)",
+            (since.isoformat(), until.isoformat(), completed_through.isoformat(), datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+    
+    def record_cost(self, message_key, seconds, completed):
+        """Remember how long one e-transfer took to process"""
+        self.conn.execute(
+            "INSERT INTO payment_costs (message_key, seconds, completed, recorded_at) VALUES (?, ?, ?, ?)",
+            (message_key, seconds, int(completed), datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+    
+    def estimate_cost(self, default, sample_size=30):
+        """Seconds one payment is expected to take: the 75th percentile of recent completed payments, or default without history"""
+        rows = self.conn.execute(
+            "SELECT seconds FROM payment_costs WHERE completed = 1 ORDER BY rowid DESC LIMIT ?", (sample_size,)
+        ).fetchall()
+        if not rows:
+            return default
+        durations = sorted(row[0] for row in rows)
+        return durations[min(len(durations) - 1, int(len(durations) * 0.75))]
+    
+    @staticmethod
+    def reached(state, step):
+        """True when state is at or past step"""
+        return state is not None and STATES.index(state) >= STATES.index(step)
+    
+    def close(self):
+        self.conn.close()
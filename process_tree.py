@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+
+try:
+    import psutil
+except ImportError:  # Optional dependency - without it the process tree is read from /proc, where there is one
+    psutil = None
+
+# False on systems without /proc (e.g. macOS) unless psutil is installed; memory limits are then not enforced
+available = psutil is not None or os.path.isdir("/proc")
+
+def read_process_table():
+    """Return ({parent pid: [child pids]}, {pid: resident MiB}) for every process; both are empty when neither psutil nor /proc is available"""
+    children = {}
+    rss_mib = {}
+    if psutil is not None:
+        for process in psutil.process_iter(["ppid", "memory_info"]):
+            info = process.info
+            if info["ppid"] is None or info["memory_info"] is None:
+                continue
+            children.setdefault(info["ppid"], []).append(process.pid)
+            rss_mib[process.pid] = info["memory_info"].rss / (1024 * 1024)
+        return children, rss_mib
+    if not os.path.isdir("/proc"):
+        return children, rss_mib
+    
+    page_mib = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces, so split after its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{entry}/statm") as f:
+                rss_mib[int(entry)] = int(f.read().split()[1]) * page_mib
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    return children, rss_mib
+
+def process_tree_pids(root_pid, children=None):
+    """A process and all its descendants (Chrome's renderer, GPU and utility processes); just the root when the table is unavailable"""
+    if children is None:
+        children = read_process_table()[0]
+    pids = []
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, ()))
+    return pids
+
+def process_tree_rss_mib(root_pid):
+    """Resident memory of a process and all its descendants; 0 when the process table is unavailable"""
+    children, rss_mib = read_process_table()
+    return sum(rss_mib.get(pid, 0) for pid in process_tree_pids(root_pid, children))
+
+def pid_alive(pid):
+    """Whether a process with this pid still exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import datetime
+import html
+import re
+import sqlite3
+
+# Rows and cells of the ledger table; payment notes hold the e-transfer reference the bot wrote there
+LEDGER_ROW_PATTERN = re.compile(r'<tr[^>]*>(.*?)</tr>', re.DOTALL | re.IGNORECASE)
+LEDGER_CELL_PATTERN = re.compile(r'<t[dh][^>]*>(.*?)</t[dh]>', re.DOTALL | re.IGNORECASE)
+# Header of the ledger column the bot writes the reference into
+NOTES_HEADERS = ("notes", "note", "memo", "comments")
+# Without a notes header, only rows with a cell naming a payment are scanned
+PAYMENT_CELL_PATTERN = re.compile(r'\b(?:payment|eft)\b', re.IGNORECASE)
+
+def extract_ledger_notes(page_source):
+    """Return the text of the ledger's notes column (or of its payment rows when there is no notes header), in one parse"""
+    notes = []
+    notes_column = None
+    for row in LEDGER_ROW_PATTERN.findall(page_source):
+        cells = [html.unescape(re.sub(r'<[^>]+>', ' ', cell)).strip() for cell in LEDGER_CELL_PATTERN.findall(row)]
+        if re.search(r'<th\b', row, re.IGNORECASE):
+            headers = [cell.lower() for cell in cells]
+            notes_column = next((i for i, header in enumerate(headers) if header in NOTES_HEADERS), None)
+            continue
+        if notes_column is not None:
+            notes.extend(cell for cell in cells[notes_column:notes_column + 1] if cell)
+        elif any(PAYMENT_CELL_PATTERN.search(cell) for cell in cells):
+            notes.append(" ".join(cells))
+    return "\n".join(notes)
+
+def contains_reference(notes, reference_number):
+    """Whether the exact reference appears in the notes as a whole word; references take any shape the bank sends"""
+    return bool(reference_number) and re.search(rf'(?<![A-Za-z0-9]){re.escape(reference_number)}(?![A-Za-z0-9])', notes or "") is not None
+
+class ReferenceIndex:
+    """The notes text of each family ledger, persisted in SQLite, for finding e-transfer references that are already posted"""
+    
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ledger_notes (
+                family_key TEXT PRIMARY KEY,
+                notes TEXT NOT NULL,
+                indexed_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.family_cache = {}  # family_key -> notes text read this run
+    
+    def set_family(self, family_key, notes):
+        """Cache and persist the notes text just read from one family's ledger"""
+        self.family_cache[family_key] = notes
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ledger_notes (family_key, notes, indexed_at) VALUES (?, ?, ?)",
+            (family_key, notes, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+    
+    def add_reference(self, family_key, reference_number):
+        """Record a reference the bot just posted to a family's ledger notes"""
+        notes = self.family_cache.get(family_key)
+        if notes is None:
+            row = self.conn.execute("SELECT notes FROM ledger_notes WHERE family_key = ?", (family_key,)).fetchone()
+            notes = row[0] if row else ""
+        self.set_family(family_key, f"{notes}\n{reference_number}" if notes else reference_number)
+    
+    def family_has(self, family_key, reference_number):
+        """True when the reference was seen on this family's ledger during the run"""
+        return contains_reference(self.family_cache.get(family_key), reference_number)
+    
+    def lookup(self, reference_number):
+        """Return the family the reference is posted to, or None"""
+        # instr() is a case-sensitive substring prefilter; the whole-word check runs on the few candidates it returns
+        rows = self.conn.execute(
+            "SELECT family_key, notes FROM ledger_notes WHERE instr(notes, ?) > 0", (reference_number,)
+        ).fetchall()
+        for family_key, notes in rows:
+            if contains_reference(notes, reference_number):
+                return family_key
+        return None
+    
+    def count(self):
+        """Number of family ledgers indexed"""
+        return self.conn.execute("SELECT COUNT(*) FROM ledger_notes").fetchone()[0]
+    
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import datetime
+import sqlite3
+
+class RetryQueue:
+    """Failed e-transfers with their reason and attempt count, retried with exponential backoff"""
+    
+    def __init__(self, db_path, base_delay_hours, max_attempts):
+        self.base_delay = datetime.timedelta(hours=base_delay_hours)
+        self.max_delay = datetime.timedelta(days=7)
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS retry_queue (
+                message_key TEXT PRIMARY KEY,
+                reference_number TEXT,
+                reason TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                next_attempt_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+    
+    def get(self, message_key):
+        row = self.conn.execute(
+            "SELECT reference_number, reason, attempts, status, next_attempt_at FROM retry_queue WHERE message_key = ?",
+            (message_key,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"reference_number": row[0], "reason": row[1], "attempts": row[2], "status": row[3], "next_attempt_at": row[4]}
+    
+    def is_due(self, message_key, now=None):
+        """False while the email is backing off or waiting in the review list"""
+        entry = self.get(message_key)
+        if entry is None:
+            return True
+        if entry["status"] == "review":
+            return False
+        now = now or datetime.datetime.now()
+        return now >= datetime.datetime.fromisoformat(entry["next_attempt_at"])
+    
+    def record_failure(self, message_key, reason, reference_number=None, review=False):
+        """Count a failed attempt and schedule the next one; returns the new status ('retry' or 'review')"""
+        entry = self.get(message_key)
+        attempts = (entry["attempts"] if entry else 0) + 1
+        reference_number = reference_number or (entry["reference_number"] if entry else None)
+        status = "review" if review or attempts >= self.max_attempts else "retry"
+        
+        now = datetime.datetime.now()
+        delay = min(self.base_delay * (2 ** (attempts - 1)), self.max_delay)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO retry_queue (message_key, reference_number, reason, attempts, status, next_attempt_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (message_key, reference_number, reason, attempts, status, (now + delay).isoformat(timespec="seconds"), now.isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+        return status
+    
+    def pending_retries(self, message_keys):
+        """The given emails that failed and are still waiting for another attempt (not yet resolved or sent to review)"""
+        return [key for key in message_keys if (self.get(key) or {}).get("status") == "retry"]
+    
+    def clear(self, message_key):
+        """Forget an email once it has been processed"""
+        self.conn.execute("DELETE FROM retry_queue WHERE message_key = ?", (message_key,))
+        self.conn.commit()
+    
+    def review_list(self):
+        """Permanent failures that need a person to look at them"""
+        rows = self.conn.execute(
+            "SELECT message_key, reference_number, reason, attempts, updated_at FROM retry_queue WHERE status = 'review' ORDER BY updated_at"
+        ).fetchall()
+        return [{"message_key": r[0], "reference_number": r[1], "reason": r[2], "attempts": r[3], "updated_at": r[4]} for r in rows]
@@ -2,24 +2,29 @@
 
 # Dance Ink Bot Cron Wrapper Script
 # This script ensures proper environment for running the bot via cron
+# Arguments are passed to dance_ink_bot.py, e.g. "run_dance_ink_bot.sh schedule"
 
-# Set the working directory
-cd "/Users/PD/PROJECTS/AUTOMATIONS/Dance Ink Bot"
+# Run from the directory this script lives in, wherever the bot is checked out
+BOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+cd "$BOT_DIR" || exit 1
 
-# Add Python to PATH (adjust if your Python is in a different location)
+# cron starts with a minimal PATH; Homebrew (Apple Silicon) provides python3 and chromedriver, and PYTHON can point at a virtualenv interpreter
 export PATH="/usr/local/bin:/usr/bin:/bin:/opt/homebrew/bin:$PATH"
+PYTHON="${PYTHON:-python3}"
 
-# Set display for headless Chrome (required for cron)
-export DISPLAY=:0
+# Only a visible (headless = False) Chrome needs a display; keep any display cron was given
+if [ -z "$DISPLAY" ] && [ -n "$BOT_DISPLAY" ]; then
+    export DISPLAY="$BOT_DISPLAY"
+fi
 
 # Log file for debugging
-LOG_FILE="/Users/PD/PROJECTS/AUTOMATIONS/Dance Ink Bot/cron.log"
+LOG_FILE="$BOT_DIR/cron.log"
 
 # Create log entry with timestamp
 echo "=== Dance Ink Bot Cron Job Started at $(date) ===" >> "$LOG_FILE"
 
-# Run the Python script and capture output
-python3 dance_ink_bot.py >> "$LOG_FILE" 2>&1
+# Run the Python script and capture output (overlapping runs exit on the bot's lock file)
+"$PYTHON" dance_ink_bot.py "$@" >> "$LOG_FILE" 2>&1
 
 # Log completion
 echo "=== Dance Ink Bot Cron Job Completed at $(date) ===" >> "$LOG_FILE"
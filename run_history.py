@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import sqlite3
+
+# Counters that mean an e-transfer was seen but not posted, by the prefix or name metrics records them under
+SKIP_COUNTERS = ("failed.", "retry_skipped.", "duplicate_blocked", "journal_skipped_completed", "deferred_for_runtime")
+
+# Step timings (see process_etransfer) that the trends report ranks
+STEP_PREFIX = "step."
+
+class RunHistory:
+    """One summary row per run (counts, skip reasons and step timings) for spotting throughput and failure trends"""
+    
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                command TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                emails_scanned INTEGER NOT NULL,
+                etransfers_found INTEGER NOT NULL,
+                posted INTEGER NOT NULL,
+                skipped TEXT NOT NULL,
+                steps TEXT NOT NULL,
+                error TEXT
+            )
+        """)
+        self.conn.commit()
+    
+    def record(self, command, started_at, counters, timings, error=None):
+        """Store a finished run from the metrics module's counters and timings"""
+        finished_at = datetime.datetime.now()
+        skipped = {name: count for name, count in counters.items() if name.startswith(SKIP_COUNTERS)}
+        # Per step: [samples, total seconds, max seconds], enough to rank steps without keeping every sample
+        steps = {
+            name[len(STEP_PREFIX):]: [len(samples), round(sum(samples), 3), round(max(samples), 3)]
+            for name, samples in timings.items() if name.startswith(STEP_PREFIX) and samples
+        }
+        self.conn.execute(
+            """INSERT INTO run_history (command, started_at, finished_at, seconds, emails_scanned, etransfers_found, posted, skipped, steps, error)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                command,
+                started_at.isoformat(timespec="seconds"),
+                finished_at.isoformat(timespec="seconds"),
+                (finished_at - started_at).total_seconds(),
+                counters.get("emails_scanned", 0),
+                counters.get("etransfers_found", 0),
+                counters.get("payments_posted", 0),
+                json.dumps(skipped),
+                json.dumps(steps),
+                error,
+            ),
+        )
+        self.conn.commit()
+    
+    def recent(self, limit=30):
+        """The last limit runs, oldest first"""
+        rows = self.conn.execute(
+            """SELECT command, started_at, seconds, emails_scanned, etransfers_found, posted, skipped, steps, error
+               FROM run_history ORDER BY id DESC LIMIT ?""",
+            (limit,),
+        ).fetchall()
+        return [
+            {
+                "command": row[0],
+                "started_at": row[1],
+                "seconds": row[2],
+                "emails_scanned": row[3],
+                "etransfers_found": row[4],
+                "posted": row[5],
+                "skipped": json.loads(row[6]),
+                "steps": json.loads(row[7]),
+                "error": row[8],
+            }
+            for row in reversed(rows)
+        ]
+    
+    def print_trends(self, limit=30, top=5):
+        """Print payments per minute for each recent run, then the slowest steps and most common skip reasons across them"""
+        runs = self.recent(limit)
+        if not runs:
+            print("No runs recorded yet")
+            return
+        
+        print(f"=== Last {len(runs)} runs ===")
+        for run in runs:
+            rate = run["posted"] / run["seconds"] * 60 if run["seconds"] else 0
+            skipped = sum(run["skipped"].values())
+            status = f" ERROR: {run['error']}" if run["error"] else ""
+            print(f"  {run['started_at']} {run['command']:<8} {run['seconds'] / 60:6.1f} min  scanned {run['emails_scanned']:>4}  found {run['etransfers_found']:>4}  posted {run['posted']:>4}  skipped {skipped:>4}  {rate:5.2f}/min{status}")
+        
+        total_posted = sum(run["posted"] for run in runs)
+        total_seconds = sum(run["seconds"] for run in runs)
+        busy = [run for run in runs if run["posted"] and run["seconds"]]
+        print(f"  Overall: {total_posted} posted in {total_seconds / 60:.1f} min ({total_posted / total_seconds * 60 if total_seconds else 0:.2f}/min)")
+        if busy:
+            # Runs that posted nothing are mostly startup and an empty mailbox, which says little about throughput
+            rates = [run["posted"] / run["seconds"] * 60 for run in busy]
+            print(f"  Runs that posted: {len(busy)}, {min(rates):.2f} - {max(rates):.2f}/min, latest {rates[-1]:.2f}/min")
+        
+        steps = {}
+        for run in runs:
+            for name, (count, total, slowest) in run["steps"].items():
+                totals = steps.setdefault(name, [0, 0, 0])
+                totals[0] += count
+                totals[1] += total
+                totals[2] = max(totals[2], slowest)
+        if steps:
+            print("  Slowest steps (mean per e-transfer):")
+            for name, (count, total, slowest) in sorted(steps.items(), key=lambda item: item[1][1] / item[1][0], reverse=True)[:top]:
+                print(f"    {name}: {total / count:.2f}s mean, {slowest:.2f}s max over {count} x, {total / 60:.1f} min total")
+        
+        reasons = {}
+        for run in runs:
+            for name, count in run["skipped"].items():
+                reasons[name] = reasons.get(name, 0) + count
+        if reasons:
+            print("  Skip and failure reasons:")
+            for name, count in sorted(reasons.items(), key=lambda item: item[1], reverse=True)[:top * 2]:
+                print(f"    {name}: {count}")
+    
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+import fcntl
+import os
+from contextlib import contextmanager
+
+@contextmanager
+def single_instance(lock_path):
+    """Yield True while holding an exclusive flock on lock_path, or False when another run holds it"""
+    lock_file = open(lock_path, "a+")
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        
+        # The pid is only informational; the kernel releases the lock if this process dies
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        lock_file.close()
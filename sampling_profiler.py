@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Named phases of the run currently in progress on the main thread, outermost first (e.g. ["fetch", "parse"])
+phases = []
+
+@contextmanager
+def phase(name):
+    """Label the wrapped block (also usable as a decorator) so samples can be grouped and filtered by phase"""
+    phases.append(name)
+    try:
+        yield
+    finally:
+        phases.pop()
+
+def iter_in_phase(iterable, name):
+    """Yield from iterable with the work of producing each item (e.g. IMAP fetches) labelled as name"""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+class SamplingProfiler:
+    """Samples the main thread's stack on a timer, weighting each sample by wall time and by the CPU time the thread used"""
+    
+    def __init__(self, output_dir, interval_ms=5, only_phase=None):
+        self.path = os.path.join(output_dir, f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}.speedscope.json")
+        self.interval = interval_ms / 1000
+        self.only_phase = only_phase
+        self.frames = []
+        self.frame_ids = {}
+        self.samples = []  # (stack of frame ids root first, wall ms, cpu ms)
+        self.running = False
+        self.thread = None
+        self.main_thread_id = threading.main_thread().ident
+        try:
+            self.cpu_clock = time.pthread_getcpuclockid(self.main_thread_id)
+        except AttributeError:
+            # macOS has no per-thread CPU clock in the standard library; fall back to the whole process minus the sampler
+            self.cpu_clock = None
+            print("⚠️ No per-thread CPU clock on this platform - CPU time is process-wide (worker threads included)")
+        self.cpu_label = "CPU in Python" if self.cpu_clock is not None else "process CPU"
+    
+    def frame_id(self, name, file=None, line=None):
+        key = (name, file, line)
+        if key not in self.frame_ids:
+            self.frame_ids[key] = len(self.frames)
+            self.frames.append({"name": name, "file": file, "line": line} if file else {"name": name})
+        return self.frame_ids[key]
+    
+    def main_thread_cpu(self):
+        if self.cpu_clock is not None:
+            return time.clock_gettime(self.cpu_clock)
+        # Runs on the sampler thread, so its own time is taken out of the process total
+        return time.process_time() - time.thread_time()
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sample_loop, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        print(f"Profiling every {self.interval * 1000:.0f}ms{f' during {self.only_phase}' if self.only_phase else ''}, writing {self.path}")
+    
+    def sample_loop(self):
+        last_wall = time.monotonic()
+        last_cpu = self.main_thread_cpu()
+        while self.running:
+            time.sleep(self.interval)
+            wall = time.monotonic()
+            cpu = self.main_thread_cpu()
+            wall_ms, cpu_ms = (wall - last_wall) * 1000, (cpu - last_cpu) * 1000
+            last_wall, last_cpu = wall, cpu
+            
+            current_phases = list(phases)
+            if self.only_phase and self.only_phase not in current_phases:
+                continue
+            frame = sys._current_frames().get(self.main_thread_id)
+            if frame is None:
+                continue
+            
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(self.frame_id(code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            # Phases become the outermost frames so the flamegraph splits by phase first
+            stack = [self.frame_id(f"[{name}]") for name in current_phases] + stack
+            self.samples.append((stack, wall_ms, min(cpu_ms, wall_ms)))
+    
+    def stop(self):
+        """Stop sampling, write the speedscope file and print the CPU versus blocked split"""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        if not self.samples:
+            print("No profile samples collected")
+            return
+        
+        profiles = []
+        for name, weight_index in (("wall time", 1), (f"CPU time ({self.cpu_label})", 2)):
+            weights = [round(sample[weight_index], 3) for sample in self.samples]
+            profiles.append({
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [sample[0] for sample in self.samples],
+                "weights": weights,
+            })
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "name": os.path.basename(self.path),
+                "exporter": "dance_ink_bot sampling_profiler",
+                "shared": {"frames": self.frames},
+                "profiles": profiles,
+            }, f)
+        self.print_summary()
+    
+    def print_summary(self, top=10):
+        wall = sum(sample[1] for sample in self.samples)
+        cpu = sum(sample[2] for sample in self.samples)
+        print(f"=== Profile ({len(self.samples)} samples, {self.path}) ===")
+        print(f"  wall {wall / 1000:.2f}s = {self.cpu_label} {cpu / 1000:.2f}s + blocked (WebDriver, IMAP, HTTP, sleeps) {(wall - cpu) / 1000:.2f}s")
+        if self.cpu_clock is None:
+            print("  (no per-thread CPU clock here: CPU includes worker threads, so the main thread's blocked time is a lower bound)")
+        
+        by_phase = {}
+        leaf_cpu = {}
+        leaf_blocked = {}
+        for stack, wall_ms, cpu_ms in self.samples:
+            phase_names = "/".join(self.frames[i]["name"][1:-1] for i in stack if self.frames[i]["name"].startswith("[")) or "other"
+            totals = by_phase.setdefault(phase_names, [0, 0])
+            totals[0] += wall_ms
+            totals[1] += cpu_ms
+            leaf = self.describe(stack[-1])
+            leaf_cpu[leaf] = leaf_cpu.get(leaf, 0) + cpu_ms
+            leaf_blocked[leaf] = leaf_blocked.get(leaf, 0) + wall_ms - cpu_ms
+        
+        for name, (wall_ms, cpu_ms) in sorted(by_phase.items(), key=lambda item: item[1][0], reverse=True):
+            print(f"  [{name}] wall {wall_ms / 1000:.2f}s, CPU {cpu_ms / 1000:.2f}s")
+        print("  Top CPU (self):")
+        for leaf, ms in sorted(leaf_cpu.items(), key=lambda item: item[1], reverse=True)[:top]:
+            print(f"    {ms / 1000:.2f}s  {leaf}")
+        print("  Top blocked (self):")
+        for leaf, ms in sorted(leaf_blocked.items(), key=lambda item: item[1], reverse=True)[:top]:
+            print(f"    {ms / 1000:.2f}s  {leaf}")
+    
+    def describe(self, frame_index):
+        frame = self.frames[frame_index]
+        if "file" not in frame:
+            return frame["name"]
+        return f"{frame['name']} ({os.path.basename(frame['file'])}:{frame['line']})"
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+import metrics
+
+# Known locators per page type, primary locator first
+SELECTORS = {
+    "admin": {
+        "search_field": [
+            (By.ID, "search"),
+            (By.NAME, "search"),
+            (By.XPATH, "//input[@type='text' and contains(@placeholder, 'search')]"),
+            (By.XPATH, "//input[@type='text']"),
+            (By.CSS_SELECTOR, "input[type='search']"),
+            (By.CSS_SELECTOR, "input.search"),
+        ],
+        "search_button": [
+            (By.XPATH, "//input[@value='Search']"),
+            (By.XPATH, "//button[contains(text(), 'Search')]"),
+            (By.XPATH, "//input[@type='submit']"),
+            (By.XPATH, "//button[@type='submit']"),
+            (By.CSS_SELECTOR, "input[type='submit']"),
+            (By.CSS_SELECTOR, "button[type='submit']"),
+        ],
+    },
+    "student": {
+        "family_link": [
+            (By.XPATH, "//a[contains(@href, 'family_id=')]"),
+            (By.XPATH, "//a[contains(@href, 'account_id=')]"),
+            (By.XPATH, "//*[@id='tab-family-content']//a[contains(@href, '.sd')]"),
+            (By.XPATH, "//table[contains(., 'Family Summary')]//a[contains(@href, '.sd')]"),
+        ],
+    },
+    "payment_form": {
+        "save_button": [
+            (By.ID, "savepayment"),
+            (By.CSS_SELECTOR, 'input[type="submit"]'),
+            (By.CSS_SELECTOR, 'button[type="submit"]'),
+            (By.CSS_SELECTOR, 'input[value*="Save"]'),
+            (By.CSS_SELECTOR, 'button[value*="Save"]'),
+            (By.CSS_SELECTOR, 'input[value*="Add"]'),
+            (By.CSS_SELECTOR, 'button[value*="Add"]'),
+            (By.CSS_SELECTOR, '.save-btn'),
+            (By.CSS_SELECTOR, '#save-payment'),
+            (By.CSS_SELECTOR, '[name="save"]'),
+            (By.CSS_SELECTOR, '[name="submit"]'),
+        ],
+    },
+    "payment_saved": {
+        "review_ledger_link": [
+            (By.XPATH, "//div[@class='contentInfo']//p[last()]//a"),
+            (By.XPATH, "//a[contains(text(), 'Review the account ledger')]"),
+            (By.XPATH, "//a[contains(text(), 'account ledger')]"),
+            (By.XPATH, "//a[contains(text(), 'Review')]"),
+            (By.XPATH, "//a[contains(text(), 'ledger')]"),
+        ],
+    },
+}
+
+# Fallbacks that match any field or button on a page; they may find an element but are never remembered as the winner
+GENERIC_LOCATORS = {
+    (By.XPATH, "//input[@type='text']"),
+    (By.XPATH, "//input[@type='submit']"),
+    (By.XPATH, "//button[@type='submit']"),
+    (By.CSS_SELECTOR, "input[type='submit']"),
+    (By.CSS_SELECTOR, "button[type='submit']"),
+    (By.CSS_SELECTOR, 'input[type="submit"]'),
+    (By.CSS_SELECTOR, 'button[type="submit"]'),
+    (By.CSS_SELECTOR, '[name="submit"]'),
+}
+
+class SelectorRegistry:
+    """Finds elements by page type and name, always trying the primary locator first and then the fallback that last succeeded"""
+    
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.preferred = {}  # "page.name" -> [by, value] of the fallback that last succeeded while the primary was missing
+        self.degraded = set()
+        
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.preferred = json.load(f)
+                print(f"Loaded {len(self.preferred)} preferred selectors from {cache_path}")
+            except Exception as e:
+                print(f"⚠️ Could not load selector cache {cache_path}: {e}")
+    
+    def ordered(self, page, name):
+        """Return the locators for an element: the primary, then the last winning fallback, then the other fallbacks"""
+        primary, *fallbacks = SELECTORS[page][name]
+        winner = self.preferred.get(f"{page}.{name}")
+        if winner and tuple(winner) in fallbacks and tuple(winner) not in GENERIC_LOCATORS:
+            fallbacks = [tuple(winner)] + [locator for locator in fallbacks if locator != tuple(winner)]
+        return [primary] + fallbacks
+    
+    def find(self, driver, page, name, timeout=0):
+        """Return the first matching element or None; only one locator waits up to timeout (the remembered fallback if any, else the primary)"""
+        wait_index = 1 if f"{page}.{name}" in self.preferred else 0
+        for i, (selector_type, selector_value) in enumerate(self.ordered(page, name)):
+            try:
+                if i == wait_index and timeout:
+                    element = WebDriverWait(driver, timeout).until(
+                        EC.presence_of_element_located((selector_type, selector_value))
+                    )
+                else:
+                    elements = driver.find_elements(selector_type, selector_value)
+                    if not elements:
+                        continue
+                    element = elements[0]
+            except Exception:
+                continue
+            
+            self.record_success(page, name, (selector_type, selector_value))
+            return element
+        
+        metrics.increment(f"selector_missing.{page}.{name}")
+        return None
+    
+    def record_success(self, page, name, locator):
+        """Remember the winning fallback, forget it once the primary works again, and flag when the primary is missing"""
+        key = f"{page}.{name}"
+        if locator == SELECTORS[page][name][0]:
+            if self.preferred.pop(key, None) is not None:
+                print(f"✅ Primary selector for {key} works again")
+                self.save()
+            return
+        
+        metrics.increment(f"selector_degraded.{key}")
+        if key not in self.degraded:
+            self.degraded.add(key)
+            print(f"⚠️ Primary selector for {key} degraded, using {locator[0]}='{locator[1]}'")
+        if locator not in GENERIC_LOCATORS and self.preferred.get(key) != list(locator):
+            self.preferred[key] = list(locator)
+            self.save()
+    
+    def save(self):
+        """Persist the winning locators so the next run starts with them"""
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump(self.preferred, f, indent=2)
+        except Exception as e:
+            print(f"⚠️ Could not save selector cache {self.cache_path}: {e}")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import urllib.request
+from config import session_store_path, session_store_key, studio_director_admin_url
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # Optional dependency - without it cookies are simply not persisted
+    Fernet = None
+
+# Base URL the cookies belong to; WebDriver only accepts cookies for the page it is on
+STUDIO_DIRECTOR_BASE_URL = "https://app.thestudiodirector.com/"
+
+def get_cipher():
+    """Return a Fernet cipher for the cookie store, or None when encryption is unavailable"""
+    if Fernet is None:
+        print("⚠️ cryptography is not installed - session cookies will not be persisted")
+        return None
+    if not session_store_key:
+        print("⚠️ SESSION_STORE_KEY is not set - session cookies will not be persisted")
+        return None
+    return Fernet(session_store_key.encode())
+
+def save_cookies(cookies):
+    """Encrypt and store the authenticated Studio Director cookies"""
+    cipher = get_cipher()
+    if cipher is None:
+        return False
+    try:
+        token = cipher.encrypt(json.dumps(cookies).encode())
+        tmp_path = f"{session_store_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(token)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, session_store_path)
+        print(f"✅ Saved {len(cookies)} session cookies to {session_store_path}")
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not save session cookies: {e}")
+        return False
+
+def load_cookies():
+    """Load the stored cookies, or an empty list if there are none or they cannot be decrypted"""
+    if not os.path.exists(session_store_path):
+        return []
+    cipher = get_cipher()
+    if cipher is None:
+        return []
+    try:
+        with open(session_store_path, "rb") as f:
+            return json.loads(cipher.decrypt(f.read()))
+    except InvalidToken:
+        print("⚠️ Stored session cookies could not be decrypted (key changed?)")
+    except Exception as e:
+        print(f"⚠️ Could not load session cookies: {e}")
+    return []
+
+def clear_cookies():
+    """Forget the stored session (e.g. after it expired)"""
+    try:
+        os.remove(session_store_path)
+    except FileNotFoundError:
+        pass
+
+def cookie_header(cookies):
+    """Build a Cookie header value from WebDriver-style cookie dicts"""
+    return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+
+def open_url(url, cookies, timeout=15):
+    """Fetch a Studio Director page over plain HTTP with the session cookies; returns (final url, html)"""
+    request = urllib.request.Request(url, headers={
+        "Cookie": cookie_header(cookies),
+        "User-Agent": "Mozilla/5.0 (Dance Ink Bot)",
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.geturl(), response.read().decode("utf-8", errors="replace")
+
+def cookies_valid(cookies):
+    """One cheap request to admin.sd: an expired session is redirected back to the login page"""
+    if not cookies:
+        return False
+    try:
+        final_url, html = open_url(studio_director_admin_url, cookies)
+        return "admin.sd" in final_url and 'name="password"' not in html
+    except Exception as e:
+        print(f"Session check failed: {e}")
+        return False
+
+def apply_to_driver(driver, cookies):
+    """Load stored cookies into a WebDriver session"""
+    driver.get(STUDIO_DIRECTOR_BASE_URL)
+    for cookie in cookies:
+        cookie = {key: value for key, value in cookie.items() if key in ("name", "value", "path", "domain", "secure", "httpOnly", "expiry")}
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            print(f"⚠️ Could not load cookie {cookie.get('name')}: {e}")
@@ -3,7 +3,7 @@
 import imaplib
 import datetime
 import email
-from config import email_username, email_password
+from config import email_username, email_password, imap_host
 
 def test_email_connection():
     print(f"Testing email connection...")
@@ -12,7 +12,7 @@ def test_email_connection():
     
     try:
         # Connect to the email server
-        mail = imaplib.IMAP4_SSL('imap.gmail.com')
+        mail = imaplib.IMAP4_SSL(imap_host)
         print("Connected to Gmail IMAP server")
         
         # Login
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import email
+import re
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+import metrics
+from sampling_profiler import phase
+
+class TransferRecord:
+    """The few fields the bot needs from one e-transfer, without keeping the raw email around"""
+    __slots__ = ("uid", "message_key", "reference_number", "amount", "sender_name",
+                 "replyto_address", "etransfer_message", "date", "review_reason")
+    
+    def __init__(self, uid, message_key, reference_number, amount, sender_name, replyto_address, etransfer_message, date):
+        self.uid = uid
+        self.message_key = message_key
+        self.reference_number = reference_number
+        self.amount = amount
+        self.sender_name = sender_name
+        self.replyto_address = replyto_address
+        self.etransfer_message = etransfer_message
+        self.date = date
+        self.review_reason = None
+    
+    def is_complete(self):
+        """A record can only be posted with a reference number, an amount and a date"""
+        return bool(self.reference_number) and self.amount is not None and self.date is not None
+    
+    def to_dict(self):
+        """JSON-friendly form stored in the payment journal"""
+        return {
+            "reference_number": self.reference_number,
+            "amount": str(self.amount) if self.amount is not None else None,
+            "sender_name": self.sender_name,
+            "replyto_address": self.replyto_address,
+            "etransfer_message": self.etransfer_message,
+            "date": self.date.isoformat() if self.date else None,
+        }
+    
+    def __repr__(self):
+        return f"TransferRecord({self.reference_number}, ${self.amount}, {self.sender_name!r}, {self.date})"
+
+def get_message_key(msg):
+    """Stable journal key for an email (IMAP sequence numbers change between sessions)"""
+    message_id = (msg["Message-ID"] or "").strip()
+    if message_id:
+        return message_id
+    return f"{msg['Date']}|{msg['Subject']}"
+
+def is_etransfer(msg):
+    return bool(msg["Subject"]) and "e-Transfer" in msg["Subject"]
+
+def get_text_body(msg):
+    """Decode only the first text/plain part; attachments are never decoded"""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain":
+                return part.get_payload(decode=True).decode('utf-8', errors='replace')
+        return ""
+    return msg.get_payload(decode=True).decode('utf-8', errors='replace')
+
+def parse_etransfer_message(msg, uid=None):
+    """Extract the payment details from an e-transfer notification into a TransferRecord"""
+    # Clean the reply-to address (remove name part)
+    reply_to = msg.get("Reply-To", "") or ""
+    if "<" in reply_to and ">" in reply_to:
+        replyto_address = reply_to.split("<")[1].split(">")[0]
+    else:
+        replyto_address = reply_to.strip()
+    
+    message_body = get_text_body(msg)
+    
+    # Reference numbers are alphanumeric
+    reference_match = re.search(r'Reference Number: ([A-Za-z0-9]+)', message_body)
+    amount_match = re.search(r'\$([0-9,]+\.?[0-9]*)', message_body)
+    sender_match = re.search(r'Sent From: (.+)', message_body)
+    message_match = re.search(r'Message: (.+)', message_body)
+    
+    try:
+        date = parsedate_to_datetime(msg["Date"]).date()
+    except Exception:
+        date = None
+    
+    return TransferRecord(
+        uid=uid,
+        message_key=get_message_key(msg),
+        reference_number=reference_match.group(1) if reference_match else None,
+        amount=Decimal(amount_match.group(1).replace(',', '')) if amount_match else None,
+        sender_name=sender_match.group(1).strip() if sender_match else "Unknown",
+        replyto_address=replyto_address,
+        etransfer_message=message_match.group(1).strip() if message_match else "",
+        date=date,
+    )
+
+def iter_transfer_records(raw_messages):
+    """Turn (uid, raw bytes) pairs into TransferRecords one at a time, dropping each raw message as soon as it is parsed"""
+    for uid, raw_message in raw_messages:
+        metrics.increment("emails_scanned")
+        with phase("parse"):
+            msg = email.message_from_bytes(raw_message)
+            subject = msg["Subject"] or ""
+            if not is_etransfer(msg):
+                print(f"❌ Skipping non-e-transfer email: {subject}")
+                continue
+            record = parse_etransfer_message(msg, uid)
+            print(f"✅ E-transfer email: {subject} -> {record}")
+        yield record